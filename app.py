@@ -2,20 +2,39 @@
 # -*- coding: utf-8 -*-
 
 # internal dependencies
+import posts as posts_module
 from posts import Posts
+from rendercache import RenderCache
+from responsecache import ResponseCacheMiddleware, LRUCache
+from compression import CompressionMiddleware, static_file_compressed, private_cache_folder, negotiate
+from sitemap import Sitemap, gunzip_stream
+from feed import AtomFeeds
+from suggest import Suggestions
+import suggest
+from thumbnails import Thumbnails, referenced_thumbnails
+from watcher import PostsWatcher
+import useragent
+import metrics
+from useragent import UserAgentProxy, EnvironFlag
 
 # external dependencies
-from bottle import Bottle, route, run, post, get, request, response, redirect, error, abort, static_file, TEMPLATE_PATH, Jinja2Template, url
-from bottle import jinja2_template as template, jinja2_view as view
+from bottle import Bottle, route, run, post, get, request, response, redirect, error, abort, static_file, TEMPLATE_PATH, Jinja2Template, url, HTTPError, http_date, parse_date
+from bottle import jinja2_template as template
+import bottle
 from bs4 import BeautifulSoup
-import user_agents
 
 # stdlib dependencies
-import json, time, os, pprint, string, re, random
+import json, time, os, pprint, string, re, random, logging, atexit, threading, hashlib, functools, weakref
 from datetime import datetime
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
 
 ### Global objects
 TEMPLATE_PATH.append(os.path.join(os.path.split(os.path.realpath(__file__))[0],'views'))
+# bottle's template loader reports templates as outdated, so Jinja2 would compile base.jinja2 for every page
+# (in debug mode bottle recreates templates for every request anyway)
+Jinja2Template.settings['auto_reload'] = False
 POSTS = object()
 BASELINK = None
 DEFAULT_CONTEXT = {
@@ -26,78 +45,119 @@ DEFAULT_CONTEXT = {
   'months': [],
   'external_links': [],
   'active': '',
-  'ua': user_agents.parse(''),
+  'ua': UserAgentProxy(),
   'additional_header_html': '',
   'additional_below_post_heading_html': '',
   'additional_leaderboard_html': '',
   'additional_sidebar_html': '',
-  'show_experiment': False,
+  'show_experiment': EnvironFlag('localblog.show_experiment'),
   'experiment_html': '',
   'favicon': None,
   'meta_author': None,
   'meta_copyright': None,
+  'feed_url': None,
 }
 ALLOW_CRAWLING = 'Disallow'
 FAVICON = None # 2-tuple containing path and filename of the favicon to serve
 EXPERIMENT_PROBABILITY = 0.01
+EXPORT_USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/115.0'
 MEDIA_FOLDER = None
+THUMBNAILS = None
+THUMBNAIL_MAX_AGE = 7 * 24 * 3600
+STATIC_FOLDER = './static'
+COMPRESSED_STATIC_FOLDER = None # gzip/brotli variants of static files, None: a temporary folder of the process
+ASSET_MAX_AGE = 365 * 24 * 3600 # for fingerprinted static files
+ASSET_VERSIONS = {} # path -> (mtime, fingerprint)
+PAGE_SIZE = 8 # posts per page of the post lists
+WARMED_UP = threading.Event()
+SITEMAP = (None, None) # ((weak reference to posts, generation), sitemap.Sitemap) built for them
+SITEMAP_LOCK = threading.Lock()
+ATOM_FEEDS = None # feed.AtomFeeds, if a baselink is set
+FEED_ENTRIES = 20 # newest posts per feed
+FEED_CACHE_BYTES = 32 * 1024 * 1024
+FEEDS = (None, None) # ((weak reference to posts, generation), LRUCache of path -> feed.Feed) built for them
+FEEDS_LOCK = threading.Lock()
+SUGGESTIONS = (None, None) # ((weak reference to posts, generation), suggest.Suggestions) built for them
+SUGGESTIONS_LOCK = threading.Lock()
+WARMUP_DEADLINE = 0 # time.time() until which requests are refused unless WARMED_UP is set
+
+class TimedJinja2Template(Jinja2Template):
+
+    def render(self, *args, **kwargs):
+        with metrics.stage('template'):
+            return super(TimedJinja2Template, self).render(*args, **kwargs)
+
+view = functools.partial(bottle.view, template_adapter=TimedJinja2Template)
 
 ### The Bottle web application
 interface = Bottle()
 
 @interface.route('/static/<path:path>')
 def static(path):
-    return static_file(path, root='./static')
+    resp = static_file_compressed(path, root=STATIC_FOLDER, cache_folder=COMPRESSED_STATIC_FOLDER)
+    if request.query.v and resp.status_code in (200, 304):
+        # the URL changes with the content of the file, see asset_url()
+        resp.set_header('Cache-Control', 'public, max-age={}, immutable'.format(ASSET_MAX_AGE))
+    return resp
 
 @interface.route('/wp-content/uploads/<path:path>')
 @interface.route('/assets/<path:path>')
 def static(path):
+    if '..' in path.replace('\\', '/').split('/'):
+        abort(404, "No such file.")
+    if THUMBNAILS and not os.path.exists(os.path.join(MEDIA_FOLDER, path)):
+        try:
+            thumbnail = THUMBNAILS.get(path)
+        except Exception as e:
+            logger.warning('Could not render the thumbnail %s: %s', path, e)
+            thumbnail = None
+        if thumbnail:
+            resp = static_file(thumbnail, root=THUMBNAILS.cache_folder)
+            if resp.status_code in (200, 304):
+                resp.set_header('Cache-Control', 'public, max-age={}'.format(THUMBNAIL_MAX_AGE))
+            return resp
     match = re.match(r".*(?P<thumb>-(?P<sizex>\d+)x(?P<sizey>\d+))\..*", path)
     if match:
         path = path.replace(match.group('thumb'), '')
     return static_file(path, root=MEDIA_FOLDER)
 
 @interface.route('/')
+@interface.route('/page/<page:int>')
 @view('list_posts.jinja2')
-def home():
+def home(page=1):
     list_title = 'The latest posts'
-    posts = POSTS.posts[:8]
-    return dict(active='home', posts=posts, list_title=list_title)
+    return dict(active='home', list_title=list_title, **paginate(POSTS.posts, page, ''))
 
 @interface.route('/tag/<tag>')
+@interface.route('/tag/<tag>/page/<page:int>')
 @view('list_posts.jinja2')
-def tag_postlist(tag):
+def tag_postlist(tag, page=1):
     list_title = 'Posts with the tag ' + tag
-    posts = [post for post in POSTS.posts if tag in post['tags']]
-    return dict(posts=posts, list_title=list_title)
+    posts = POSTS.tagged(tag)
+    list_feed_url = '/tag/{}/feed.xml'.format(tag) if ATOM_FEEDS else None
+    return dict(list_title=list_title, list_feed_url=list_feed_url, **paginate(posts, page, '/tag/' + tag))
 
 @interface.route('/category/<category>')
+@interface.route('/category/<category>/page/<page:int>')
 @view('list_posts.jinja2')
-def category_postlist(category):
+def category_postlist(category, page=1):
     list_title = 'Posts with the category ' + category
-    posts = [post for post in POSTS.posts if category in post['categories']]
-    return dict(posts=posts, list_title=list_title)
+    posts = POSTS.categorized(category)
+    list_feed_url = '/category/{}/feed.xml'.format(category) if ATOM_FEEDS else None
+    return dict(list_title=list_title, list_feed_url=list_feed_url, **paginate(posts, page, '/category/' + category))
 
 @interface.route('/tags')
 @view('property_list.jinja2')
 def taglist():
     descr = 'All tags given to blog posts in this blog:'
-    ret_list = []
-    ct = concat_tags()
-    for tag in unique_tags():
-        ret_list.append({'name': tag, 'occurrence': ct.count(tag)})
-    ret_list = sorted(ret_list, key=lambda k: k['occurrence'], reverse=True)
+    ret_list = [{'name': tag, 'occurrence': occurrence} for tag, occurrence in tag_occurrences().most_common()]
     return dict(property=ret_list, introduction_paragraph=descr, property_name='Tag', active='tags')
 
 @interface.route('/categories')
 @view('property_list.jinja2')
 def categorylist():
     descr = 'The categories of posts in this blog:'
-    ret_list = []
-    cc = concat_categories()
-    for category in unique_categories():
-        ret_list.append({'name': category, 'occurrence': cc.count(category)})
-    ret_list = sorted(ret_list, key=lambda k: k['occurrence'], reverse=True)
+    ret_list = [{'name': category, 'occurrence': occurrence} for category, occurrence in category_occurrences().most_common()]
     return dict(property=ret_list, introduction_paragraph=descr, property_name='Category', active='categories')
 
 @interface.route('/search')
@@ -105,57 +165,68 @@ def categorylist():
 def search():
     return dict(active='search', posts=[])
 
+@interface.route('/search/suggest')
+def search_suggest():
+    if 'q' not in request.query:
+        # a search for the word
+        return search('suggest')
+    limit = request.query.get('limit', suggest.MAX_RESULTS, type=int)
+    completions = current_suggestions().complete(request.query.q, limit)
+    return dict(query=request.query.q, suggestions=[dict(text=text, kind=kind, url=url) for text, kind, url in completions])
+
 @interface.route('/search/<search_phrase>')
 @view('search.jinja2')
 def search(search_phrase):
-    results = POSTS.search_literally(search_phrase)
+    if request.query.get('order') == 'literal':
+        results = POSTS.search_literally(search_phrase)
+    else:
+        results = POSTS.search(search_phrase)
     return dict(active='search', posts=results, search_phrase=search_phrase)
 
 @interface.route('/<year:int>')
+@interface.route('/<year:int>/page/<page:int>')
 @view('list_posts.jinja2')
-def year_postlist(year):
+def year_postlist(year, page=1):
     list_title = 'Posts from {:04d}'.format(year)
-    posts = [post for post in POSTS.posts if post['year'] == year]
-    return dict(posts=posts, list_title=list_title)
+    posts = POSTS.from_year(year)
+    return dict(list_title=list_title, **paginate(posts, page, '/{:04d}'.format(year)))
 
 @interface.route('/<year:int>/<month:int>')
+@interface.route('/<year:int>/<month:int>/page/<page:int>')
 @view('list_posts.jinja2')
-def year_month_postlist(year, month):
+def year_month_postlist(year, month, page=1):
     list_title = 'Posts from {:04d}-{:02d}'.format(year, month)
-    posts = [post for post in POSTS.posts if post['year'] == year and post['month'] == month]
-    return dict(posts=posts, list_title=list_title)
+    posts = POSTS.from_month(year, month)
+    return dict(list_title=list_title, **paginate(posts, page, '/{:04d}/{:02d}'.format(year, month)))
 
 @interface.route('/latest')
 @view('post.jinja2')
 def latest_post():
     post = POSTS.latest
-    redirect(post['address'] or '/post/{status}/{file}'.format(**post))
+    redirect(post_path(post))
 
 @interface.route('/post/<id>')
 @view('post.jinja2')
 def post_from_filename(id):
-    result =  [post for post in POSTS.posts if os.path.splitext(os.path.basename(post['file']))[0] == id]
-    if len(result) == 1:
-        post = result[0]
-        return dict(post=result[0])
+    post = POSTS.post_by_id(id)
+    if post:
+        return dict(post=post, related=POSTS.related_posts(post))
     else: abort(404, "No such blog post.")
 
 @interface.route('/post/<status>/<file>')
 @view('post.jinja2')
 def post_from_filename(status, file):
-    result = [post for post in POSTS.posts if post['status'] == status and post['file'] == file]
-    if len(result) == 1:
-        post = result[0]
-        return dict(post=result[0])
+    post = POSTS.post_by_file(status, file)
+    if post:
+        return dict(post=post, related=POSTS.related_posts(post))
     else: abort(404, "No such blog post.")
 
 @interface.route('/<year:int>/<month:int>/<slug>')
 @view('post.jinja2')
 def post_from_link(year, month, slug):
-    result = [post for post in POSTS.posts if post['year'] == year and post['month'] == month and post['slug'] == slug]
-    if len(result) == 1:
-        post = result[0]
-        return dict(post=result[0])
+    post = POSTS.post_by_link(year, month, slug)
+    if post:
+        return dict(post=post, related=POSTS.related_posts(post))
     else: abort(404, "No such blog post.")
 
 @interface.route('/robots.txt')
@@ -164,33 +235,41 @@ def robots():
     return "User-agent: *\n{0}: /".format(ALLOW_CRAWLING)
 
 @interface.route('/sitemap.xml')
-@view('sitemap.jinja2')
-def sitemap():
+@interface.route('/sitemap-<number:int>.xml')
+def sitemap(number=None):
     if not BASELINK:
         abort(404, "No baselink set -> no sitemap available due to missing absolute URLs.")
-    #response.content_type = 'xml/application'
+    data, etag = current_sitemap().document(request.path)
+    if data is None:
+        abort(404, "No such sitemap.")
     response.content_type = 'text/xml;charset=UTF-8'
-    urls = []
-    urls.append({'loc': BASELINK, 'priority': '1.0'})
-    urls.append({'loc': BASELINK + '/search', 'priority': '0.5'})
-    for post in POSTS.posts:
-        url = {}
-        if post['address']:
-            url['loc'] = BASELINK + post['address']
-        else:
-            url['loc'] = BASELINK + '/post/{status}/{file}'.format(**post)
-        url['lastmod'] = post['modification_date'].date().isoformat()
-        url['priority'] = '{:.1f}'.format(1.0)
-        urls.append(url)
-    for tag in unique_tags():
-        urls.append({'loc': BASELINK + '/tag/' + tag, 'priority': '0.2'})
-    for category in unique_categories():
-        urls.append({'loc': BASELINK + '/category/' + category, 'priority': '0.2'})
-    for d in POSTS.years:
-        urls.append({'loc': BASELINK + '/{year}'.format(year=d.year), 'priority': '0.2'})
-    for d in POSTS.months:
-        urls.append({'loc': BASELINK + '/{year}/{month}'.format(year=d.year, month=d.month), 'priority': '0.2'})
-    return {'urls': urls}
+    response.set_header('ETag', etag)
+    response.set_header('Vary', 'Accept-Encoding')
+    if not_modified(etag):
+        response.status = 304
+        return ''
+    if negotiate(request.get_header('Accept-Encoding'), ('gzip',)):
+        response.set_header('Content-Encoding', 'gzip')
+        response.content_length = len(data)
+        return data
+    return gunzip_stream(data)
+
+@interface.route('/feed.xml')
+@interface.route('/tag/<tag>/feed.xml')
+@interface.route('/category/<category>/feed.xml')
+def atom_feed(tag=None, category=None):
+    if not ATOM_FEEDS:
+        abort(404, "No baselink set -> no feeds available due to missing absolute URLs.")
+    feed = current_feed(request.path, tag, category)
+    if feed is None:
+        abort(404, "No such feed.")
+    response.content_type = 'application/atom+xml;charset=UTF-8'
+    response.set_header('ETag', feed.etag)
+    response.set_header('Last-Modified', http_date(feed.last_modified))
+    if not_modified(feed.etag, feed.last_modified):
+        response.status = 304
+        return ''
+    return feed.data
 
 @interface.route('/favicon.ico')
 def get_favicon():
@@ -202,35 +281,277 @@ def get_favicon():
 
 
 @interface.hook('before_request')
-def set_ua():
-    ua_string = request.environ.get('HTTP_USER_AGENT', '')
-    ua = user_agents.parse(ua_string)
-    Jinja2Template.defaults['ua'] = ua
-    Jinja2Template.defaults['show_experiment'] = random.random() < EXPERIMENT_PROBABILITY
+def refuse_while_warming_up():
+    if not WARMED_UP.is_set() and time.time() < WARMUP_DEADLINE:
+        retry_after = max(1, int(WARMUP_DEADLINE - time.time()))
+        raise HTTPError(503, "The blog is warming up, please try again shortly.", Retry_After=str(retry_after))
+
+@interface.hook('before_request')
+def draw_experiment():
+    # the response cache may have drawn it already, see response_variant()
+    if 'localblog.show_experiment' not in request.environ:
+        request.environ['localblog.show_experiment'] = random.random() < EXPERIMENT_PROBABILITY
 
 
 ### posts helper functions
 
-def concat_tags():
+def page_count(posts):
+    return max(1, -(-len(posts) // PAGE_SIZE))
+
+def paginate(posts, page, base_url):
+    """ Return the template variables for the given page of a list of posts found at base_url """
+    pages = page_count(posts)
+    if not 1 <= page <= pages:
+        abort(404, "No such page.")
+    def page_url(page):
+        return base_url + '/page/{}'.format(page) if page > 1 else base_url or '/'
+    return {
+      'posts': posts[(page - 1) * PAGE_SIZE:page * PAGE_SIZE],
+      'page': page,
+      'pages': pages,
+      'newer_url': page_url(page - 1) if page > 1 else None,
+      'older_url': page_url(page + 1) if page < pages else None,
+    }
+
+def tag_occurrences(posts=None):
+    """ Return a Counter of all tags found in any post """
+    return (posts or POSTS).tag_counts
+
+def category_occurrences(posts=None):
+    """ Return a Counter of all categories found in any post. Exclude the special 'Uncategorized' category. """
+    categories = (posts or POSTS).category_counts
+    if 'Uncategorized' in categories:
+        categories = categories.copy()
+        del categories['Uncategorized']
+    return categories
+
+def concat_tags(posts=None):
     """ Return a concatenated list of all tags found in any post """
-    tags = []
-    for post in POSTS.posts:
-        tags += post['tags']
-    return tags
+    return list(tag_occurrences(posts).elements())
 
-def concat_categories():
+def concat_categories(posts=None):
     """ Return a concatenated list of all categories found in any post. Exclude the special 'Uncategorized' category. """
-    categories = []
-    for post in POSTS.posts:
-        categories += post['categories']
-    return [c for c in categories if c != 'Uncategorized']
-
-def unique_tags():
-    return set(concat_tags())
-
-def unique_categories():
-    return set(concat_categories())
-
+    return list(category_occurrences(posts).elements())
+
+def unique_tags(posts=None):
+    return set(tag_occurrences(posts))
+
+def unique_categories(posts=None):
+    return set(category_occurrences(posts))
+
+
+def response_variant(environ):
+    """ Return what a cacheable response depends on besides its URL and the posts, or None if it must not be cached """
+    # the experiment is drawn here so that its responses can bypass the response cache
+    environ['localblog.show_experiment'] = random.random() < EXPERIMENT_PROBABILITY
+    if environ['localblog.show_experiment']:
+        return None
+    ua = useragent.user_agent(environ)
+    # the only properties of the user agent used by the templates
+    return ua.is_pc, ua.is_tablet
+
+def asset_url(path):
+    """ Return the URL of a static file with a fingerprint of its content (allowing clients to cache it forever) """
+    filename = os.path.join(STATIC_FOLDER, path)
+    try:
+        mtime = os.stat(filename).st_mtime_ns
+    except OSError:
+        return '/static/' + path
+    version = ASSET_VERSIONS.get(path)
+    if version is None or version[0] != mtime:
+        with open(filename, 'rb') as f:
+            version = (mtime, hashlib.sha1(f.read()).hexdigest()[:12])
+        ASSET_VERSIONS[path] = version
+    return '/static/{}?v={}'.format(path, version[1])
+
+def site_paths(posts):
+    """ Return the paths of all pages served for the posts (for a static export) """
+    paths = ['/', '/tags', '/categories', '/search', '/robots.txt']
+    if BASELINK:
+        paths += current_sitemap(posts).paths
+    if ATOM_FEEDS:
+        paths.append('/feed.xml')
+        paths += ['/tag/{}/feed.xml'.format(tag) for tag in posts.tag_counts if has_pages(tag)]
+        paths += ['/category/{}/feed.xml'.format(category) for category in posts.category_counts if has_pages(category)]
+    for post in posts.posts:
+        paths.append(post_path(post))
+    # the stylesheets, scripts and fonts the pages use (the media folder is not exported)
+    for folder, _, names in os.walk(STATIC_FOLDER):
+        paths += sorted('/static/' + os.path.relpath(os.path.join(folder, name), STATIC_FOLDER).replace(os.sep, '/') for name in names)
+    def with_pages(base_url, posts_of_list):
+        return [base_url or '/'] + [base_url + '/page/{}'.format(page) for page in range(2, page_count(posts_of_list) + 1)]
+    paths += with_pages('', posts.posts)[1:]
+    for tag in posts.tag_counts:
+        if has_pages(tag): paths += with_pages('/tag/' + tag, posts.tagged(tag))
+    for category in posts.category_counts:
+        if has_pages(category): paths += with_pages('/category/' + category, posts.categorized(category))
+    for d in posts.years:
+        paths += with_pages('/{:04d}'.format(d.year), posts.from_year(d.year))
+    for d in posts.months:
+        # the archive links to /2018/01/, the sitemap to /2018/1
+        paths += with_pages('/{:04d}/{:02d}'.format(d.year, d.month), posts.from_month(d.year, d.month))
+        paths.append('/{}/{}'.format(d.year, d.month))
+    return paths
+
+def has_pages(name):
+    """ Whether a tag or category has pages of its own: there are no routes to empty names, dot segments and names with a slash """
+    return bool(name) and '/' not in name and name not in ('.', '..')
+
+def post_path(post):
+    return post['address'] or '/post/{status}/{file}'.format(**post)
+
+def not_modified(etag, last_modified=None):
+    """ Check the conditional headers of the request against the ETag (and timestamp) of the response """
+    if_none_match = request.get_header('If-None-Match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or 'W/' + etag in tags
+    if_modified_since = request.get_header('If-Modified-Since')
+    if if_modified_since and last_modified is not None:
+        since = parse_date(if_modified_since.split(';')[0].strip())
+        return since is not None and since >= int(last_modified)
+    return False
+
+def last_modified(posts):
+    return max(post['modification_date'] for post in posts) if posts else None
+
+def sitemap_urls(posts):
+    """ Yield (path, last modification, priority) of every page listed in the sitemap """
+    yield '', posts.last_modified, '1.0'
+    yield '/search', None, '0.5'
+    for post in posts.posts:
+        yield post_path(post), post['modification_date'], '1.0'
+    for tag in sorted(unique_tags(posts)):
+        yield '/tag/' + quote(tag), last_modified(posts.tagged(tag)), '0.2'
+    for category in sorted(unique_categories(posts)):
+        yield '/category/' + quote(category), last_modified(posts.categorized(category)), '0.2'
+    for d in posts.years:
+        yield '/{}'.format(d.year), last_modified(posts.from_year(d.year)), '0.2'
+    for d in posts.months:
+        yield '/{}/{}'.format(d.year, d.month), last_modified(posts.from_month(d.year, d.month)), '0.2'
+
+def current_sitemap(posts=None):
+    """ Return the Sitemap of the posts, built once per generation of them """
+    global SITEMAP
+    posts = posts or POSTS
+    key = (weakref.ref(posts), posts.generation)
+    with SITEMAP_LOCK:
+        if SITEMAP[0] != key:
+            start = time.time()
+            SITEMAP = (key, Sitemap(BASELINK, sitemap_urls(posts)))
+            logger.info('Built the sitemap in %.2f s', time.time() - start)
+        return SITEMAP[1]
+
+def current_feed(path, tag=None, category=None):
+    """ Return the feed.Feed served at path (of the posts with the tag or category, if given), or None if there is none """
+    global FEEDS
+    posts = POSTS
+    key = (weakref.ref(posts), posts.generation)
+    with FEEDS_LOCK:
+        if FEEDS[0] != key:
+            FEEDS = (key, LRUCache(FEED_CACHE_BYTES, sizeof=lambda feed: len(feed.data)))
+        feeds = FEEDS[1]
+    feed = feeds.get(path)
+    if feed is None:
+        if tag is not None:
+            selected, subtitle = posts.tagged(tag), 'Posts with the tag ' + tag
+        elif category is not None:
+            selected, subtitle = posts.categorized(category), 'Posts with the category ' + category
+        else:
+            selected, subtitle = posts.posts, None
+        if not selected and (tag is not None or category is not None):
+            return None
+        with metrics.stage('feed'):
+            feed = ATOM_FEEDS.build(path, subtitle, selected[:FEED_ENTRIES])
+        feeds.put(path, feed)
+    return feed
+
+def current_suggestions(posts=None):
+    """ Return the search Suggestions for the posts, built once per generation of them """
+    global SUGGESTIONS
+    posts = posts or POSTS
+    key = (weakref.ref(posts), posts.generation)
+    with SUGGESTIONS_LOCK:
+        if SUGGESTIONS[0] != key:
+            start = time.time()
+            items = [(post['title'], 'post', post_path(post), 1.) for post in posts.posts]
+            items += [(tag, 'tag', '/tag/' + tag, count) for tag, count in tag_occurrences(posts).items() if has_pages(tag)]
+            items += [(category, 'category', '/category/' + category, count)
+                      for category, count in category_occurrences(posts).items() if has_pages(category)]
+            SUGGESTIONS = (key, Suggestions(items))
+            logger.info('Built the search suggestions in %.2f s', time.time() - start)
+        return SUGGESTIONS[1]
+
+def prepare_search(posts):
+    """ Build the suggestions, the search index and the related posts for the posts before requests need them """
+    current_suggestions(posts)
+    posts.search_index
+    posts.update_related()
+
+def reload_posts(changed_files, removed_files, prepare=True):
+    """ Replace POSTS with a snapshot in which the given files are re-read or dropped, then prepare_search() unless prepare is False """
+    global POSTS
+    posts = POSTS.updated(changed_files, removed_files)
+    DEFAULT_CONTEXT['months'] = posts.months
+    POSTS = posts
+    if prepare:
+        prepare_search(posts)
+
+def rescan_posts(folder, changed_files=None, removed_files=None):
+    """
+    Re-read the changed files of the posts folder, replacing POSTS. Unless the changed and removed
+    files are given (as found by a PostsWatcher), the files are compared with the posts by their
+    size and modification time. The search is not prepared for them: warm_up() does it after
+    rendering them.
+    """
+    if changed_files is None and removed_files is None:
+        files = set(name for name in os.listdir(folder) if name.endswith('.' + posts_module.FILE_EXTENSION))
+        changed_files = [name for name in sorted(files) if name not in POSTS.files or POSTS.files[name].modified()]
+        removed_files = [name for name in POSTS.files if name not in files]
+    reload_posts(changed_files or [], removed_files or [], prepare=False)
+
+def warm_up(posts, workers):
+    start = time.time()
+    posts.prerender(workers)
+    WARMED_UP.set()
+    logger.info('Rendered %d posts in %.1f s', posts.total(), time.time() - start)
+    prepare_search(posts)
+
+
+def request_route(environ):
+    """ Return the rule of the route a request was handled by (for the metrics) """
+    route = environ.get('bottle.route')
+    if route is None:
+        # answered by a middleware, e.g. from the response cache (not timed as a stage: the request is over)
+        match = getattr(interface.router.match, '__wrapped__', interface.router.match)
+        try:
+            route, _ = match(environ)
+        except HTTPError:
+            return 'unknown'
+    return route.rule
+
+def cache_lookups(response_cache=None, compression=None):
+    """ Return the hits and misses of the caches as samples for the metrics """
+    caches = []
+    if response_cache: caches.append(('response', response_cache.cache.hits, response_cache.cache.misses))
+    if compression: caches.append(('compression', compression.cache.hits, compression.cache.misses))
+    caches.append(('html', posts_module.HTML_CACHE.hits, posts_module.HTML_CACHE.misses))
+    if posts_module.RENDER_CACHE:
+        stats = posts_module.RENDER_CACHE.stats()
+        caches.append(('render', stats['hits'], stats['misses']))
+    info = useragent.parse.cache_info()
+    caches.append(('user_agent', info.hits, info.misses))
+    for cache, hits, misses in caches:
+        yield (cache, 'hit'), hits
+        yield (cache, 'miss'), misses
+
+def time_route_lookup(router):
+    match = router.match
+    def timed_match(environ):
+        with metrics.stage('route'):
+            return match(environ)
+    timed_match.__wrapped__ = match
+    router.match = timed_match
 
 class StripPathMiddleware(object):
   def __init__(self, app):
@@ -240,19 +561,8 @@ class StripPathMiddleware(object):
     return self.app(e,h)
 
 
-def main():
-    global POSTS, DEFAULT_CONTEXT, ALLOW_CRAWLING, FAVICON, EXPERIMENT_PROBABILITY, MEDIA_FOLDER, BASELINK
-    import argparse
-    parser = argparse.ArgumentParser( 
-      description='Run a local blog.' )
-    parser.add_argument('-p', '--port', type=int, default=8080,
-      help='The port to run the web server on.')
-    parser.add_argument('-6', '--ipv6', action='store_true',
-      help='Listen to incoming connections via IPv6 instead of IPv4.')
-    parser.add_argument('-d', '--debug', action='store_true',
-      help='Start in debug mode (with verbose HTTP error pages.')
-    parser.add_argument('-l', '--log-file',
-      help='The file to store the server log in.')
+def add_blog_arguments(parser):
+    """ Add the arguments configuring the content of the blog (shared by the server and the export) """
     parser.add_argument('--allow-crawling', action='store_true', help='Allow search engines to index the site.')
     parser.add_argument('--title', '-t', help='The title of the blog')
     parser.add_argument('--about', help='Markdown description of the blog or author')
@@ -268,21 +578,45 @@ def main():
     parser.add_argument('--experiment-probability', type=float, help='Set a probability for showing an experiment (instead of the additional HTML in the leaderboard)')
     parser.add_argument('--experiment-html', help='HTML content to show if the experiment is carried out. Will show instead of leaderboard')
     parser.add_argument('--copyright', default="Copyright (c)", help='Copyright statement')
-    parser.add_argument('--logfile', help='(Optional) logfile to log requests to')
     parser.add_argument('--baselink', '-b',
       help='Baselink of your blog, like http://philipp.wordpress.com')
     parser.add_argument('--media-folder', help='The folder containing the media files (defaults to "assets" inside the blog entries folder).')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help='Number of posts per page of the post lists (default: %(default)s).')
+    parser.add_argument('--feed-entries', type=int, default=FEED_ENTRIES, help='Number of the newest posts in the Atom feeds (default: %(default)s).')
+    parser.add_argument('--feed-previews', action='store_true', help='Put only the previews of posts into the Atom feeds, not the full posts.')
+    parser.add_argument('--thumbnail-cache', help='Folder to keep the thumbnails of images in (defaults to the media folder with "-thumbnails" appended).')
+    parser.add_argument('--render-cache', help='Folder to keep rendered posts in across restarts (can be shared by several processes).')
+    parser.add_argument('--render-cache-size', type=int, default=256, help='Maximum size of the render cache in MiB (default: 256).')
+    parser.add_argument('--html-cache-size', type=int, default=64, help='Maximum size of the rendered posts kept in memory in MiB (default: 64).')
+    parser.add_argument('--load-workers', type=int, help='Number of processes to read, parse and (with --prerender) render the posts with at startup.')
+    parser.add_argument('--no-manifest', action='store_true', help='Do not keep a manifest of the parsed posts in the folder of blog entries (it makes restarts faster).')
     parser.add_argument('folder', help='The folder of blog entries.')
-    args = parser.parse_args()
+
+def configure(args):
+    """ Load the posts and set up the global objects according to the arguments added by add_blog_arguments() """
+    global POSTS, DEFAULT_CONTEXT, ALLOW_CRAWLING, FAVICON, EXPERIMENT_PROBABILITY, MEDIA_FOLDER, BASELINK, THUMBNAILS, PAGE_SIZE, ATOM_FEEDS, FEED_ENTRIES
+    logging.basicConfig(level=logging.INFO)
+
+    PAGE_SIZE = max(1, args.page_size)
+    FEED_ENTRIES = max(1, args.feed_entries)
 
     ALLOW_CRAWLING = 'Allow' if args.allow_crawling else 'Disallow'
 
-    POSTS = Posts(args.folder)
+    posts_module.HTML_CACHE = LRUCache(args.html_cache_size * 1024 * 1024, sizeof=posts_module.HTML_CACHE.sizeof)
+    if args.render_cache:
+        posts_module.RENDER_CACHE = RenderCache(args.render_cache, args.render_cache_size * 1024 * 1024)
+        atexit.register(posts_module.RENDER_CACHE.report)
+    atexit.register(useragent.report)
+
+    POSTS = Posts(args.folder, workers=args.load_workers, manifest=not args.no_manifest)
 
     if args.media_folder:
         MEDIA_FOLDER = args.media_folder
     else:
         MEDIA_FOLDER = os.path.join(args.folder, 'assets')
+    THUMBNAILS = Thumbnails(MEDIA_FOLDER, args.thumbnail_cache or os.path.normpath(MEDIA_FOLDER) + '-thumbnails')
+    if not THUMBNAILS.available:
+        logger.warning('Pillow is not installed, serving the original images instead of thumbnails.')
 
     if args.baselink:
         BASELINK = args.baselink
@@ -291,6 +625,7 @@ def main():
         POSTS.keep_only_published()
 
     DEFAULT_CONTEXT['months'] = POSTS.months
+    DEFAULT_CONTEXT['asset_url'] = asset_url
 
     if args.external_links:
         for el in args.external_links.split(','):
@@ -333,9 +668,78 @@ def main():
 
     if args.title : DEFAULT_CONTEXT['blog_title'] = args.title
 
+    if BASELINK:
+        ATOM_FEEDS = AtomFeeds(BASELINK, DEFAULT_CONTEXT['blog_title'], DEFAULT_CONTEXT['author'], post_path, previews=args.feed_previews)
+        DEFAULT_CONTEXT['feed_url'] = '/feed.xml'
+
     Jinja2Template.defaults = DEFAULT_CONTEXT
 
-    app = StripPathMiddleware(interface)
+def main():
+    global WARMUP_DEADLINE, COMPRESSED_STATIC_FOLDER
+    import argparse, sys
+    if sys.argv[1:2] == ['export']:
+        return export_main(sys.argv[2:])
+    if sys.argv[1:2] == ['thumbnails']:
+        return thumbnails_main(sys.argv[2:])
+    parser = argparse.ArgumentParser( 
+      description='Run a local blog. Use "%(prog)s export --help" to learn about exporting it as static files instead '
+                  'and "%(prog)s thumbnails --help" about rendering the thumbnails of images in advance.' )
+    parser.add_argument('-p', '--port', type=int, default=8080,
+      help='The port to run the web server on.')
+    parser.add_argument('-6', '--ipv6', action='store_true',
+      help='Listen to incoming connections via IPv6 instead of IPv4.')
+    parser.add_argument('-d', '--debug', action='store_true',
+      help='Start in debug mode (with verbose HTTP error pages.')
+    parser.add_argument('-l', '--log-file',
+      help='The file to store the server log in.')
+    parser.add_argument('--logfile', help='(Optional) logfile to log requests to')
+    parser.add_argument('--prerender', action='store_true', help='Render all posts at startup. Requests are refused until this is done or the warm-up deadline passed.')
+    parser.add_argument('--warmup-deadline', type=float, default=60., help='Seconds after which requests are served even if pre-rendering is not done yet (default: 60).')
+    parser.add_argument('--response-cache-size', type=int, default=64, help='Maximum size of the in-memory cache of rendered pages in MiB (default: 64, 0 disables the cache).')
+    parser.add_argument('--compression-min-size', type=int, default=1024, help='Compress pages larger than this many bytes if the client accepts gzip or brotli (default: 1024).')
+    parser.add_argument('--no-compression', action='store_true', help='Do not compress pages on the fly.')
+    parser.add_argument('--static-cache', help='Folder to keep compressed variants of the static files in. It must belong to the user running the blog and must not be writable by others (default: a new temporary folder).')
+    parser.add_argument('--workers', '-w', type=int, default=0, help='Serve with this many worker processes sharing the posts rendered by a master process. Send SIGHUP to the master to reload the posts without downtime.')
+    parser.add_argument('--max-requests', type=int, default=0, help='Replace a worker process after it served this many requests (default: 0, never).')
+    parser.add_argument('--metrics', action='store_true', help='Time requests and serve the metrics in the Prometheus text format at /metrics.')
+    parser.add_argument('--slow-request', type=float, metavar='MS', help='Log requests taking longer than this many milliseconds with the time spent in every stage.')
+    parser.add_argument('--watch', action='store_true', help='Reload posts that were added, changed or deleted without restarting.')
+    parser.add_argument('--watch-interval', type=float, default=2., help='Seconds between checks for changed posts if inotify is not available (default: 2).')
+    add_blog_arguments(parser)
+    args = parser.parse_args()
+
+    configure(args)
+    # created before worker processes are forked, so that they share it
+    COMPRESSED_STATIC_FOLDER = args.static_cache or private_cache_folder()
+
+    # with worker processes, the master renders the posts in prepare() (see below) before forking them
+    if args.prerender and not args.workers:
+        WARMUP_DEADLINE = time.time() + args.warmup_deadline
+        threading.Thread(target=warm_up, args=(POSTS, args.load_workers), daemon=True).start()
+    elif not args.workers:
+        WARMED_UP.set()
+        # build the search index in the background instead of making the first search wait for it
+        threading.Thread(target=prepare_search, args=(POSTS,), daemon=True).start()
+
+    if args.watch and not args.workers:
+        PostsWatcher(args.folder, posts_module.FILE_EXTENSION, reload_posts, interval=args.watch_interval).start()
+
+    app = interface
+    response_cache = compression = None
+    if args.response_cache_size:
+        app = response_cache = ResponseCacheMiddleware(app, lambda: (POSTS.generation, POSTS.related_version), response_variant,
+                                                       max_bytes=args.response_cache_size * 1024 * 1024)
+    if not args.no_compression:
+        app = compression = CompressionMiddleware(app, min_size=args.compression_min_size)
+    app = StripPathMiddleware(app)
+    if args.metrics or args.slow_request is not None:
+        time_route_lookup(interface.router)
+        metrics.REGISTRY.register(metrics.Callback('localblog_cache_lookups_total', 'Lookups in the caches by result', 'counter',
+                                                   ('cache', 'result'), lambda: cache_lookups(response_cache, compression)))
+        metrics.REGISTRY.register(metrics.Callback('localblog_posts', 'Number of posts served', 'gauge', (),
+                                                   lambda: [((), POSTS.total())]))
+        app = metrics.MetricsMiddleware(app, request_route, path='/metrics' if args.metrics else None,
+                                        slow_request=args.slow_request / 1000. if args.slow_request is not None else None)
 
     if args.logfile:
         from requestlogger import WSGILogger, ApacheFormatter
@@ -346,7 +750,40 @@ def main():
 
     if args.debug and args.ipv6:
         args.error('You cannot use IPv6 in debug mode, sorry.')
-    if args.debug:
+    if args.workers:
+        if args.debug:
+            parser.error('You cannot use several worker processes in debug mode, sorry.')
+        from prefork import PreforkServer
+        prepared = []
+        watched = (set(), set()) # files changed and removed since the last reload, see on_change()
+        watched_lock = threading.Lock()
+        def prepare():
+            # the master process renders all posts before forking the workers
+            if prepared:
+                with watched_lock:
+                    changed, removed = sorted(watched[0]), sorted(watched[1])
+                    watched[0].clear()
+                    watched[1].clear()
+                if changed or removed:
+                    rescan_posts(args.folder, changed, removed)
+                else:
+                    rescan_posts(args.folder)
+            warm_up(POSTS, args.load_workers)
+            prepared.append(True)
+            return app
+        def on_change(changed, removed):
+            with watched_lock:
+                watched[0].difference_update(removed)
+                watched[0].update(changed)
+                watched[1].difference_update(changed)
+                watched[1].update(removed)
+            server.reload()
+        server = PreforkServer(prepare, host='::' if args.ipv6 else '0.0.0.0', port=args.port,
+                               workers=args.workers, max_requests=args.max_requests)
+        if args.watch:
+            PostsWatcher(args.folder, posts_module.FILE_EXTENSION, on_change, interval=args.watch_interval).start()
+        server.serve_forever()
+    elif args.debug:
         run(app, host='0.0.0.0', port=args.port, debug=True, reloader=True)
     else:
         if args.ipv6:
@@ -355,6 +792,43 @@ def main():
         else:
             run(app, host='0.0.0.0', server='paste', port=args.port)
 
+def export_main(argv):
+    global EXPERIMENT_PROBABILITY
+    import argparse
+    from export import export_site, BROTLI_QUALITY
+    parser = argparse.ArgumentParser(prog='app.py export',
+      description='Export all pages of the blog as static files (with gzip and brotli compressed variants) to be served by a web server like nginx.')
+    parser.add_argument('--output', '-O', required=True, help='The folder to export the blog to.')
+    parser.add_argument('--workers', '-w', type=int, help='Number of processes to render the pages with.')
+    parser.add_argument('--user-agent', default=EXPORT_USER_AGENT, help='The user agent to render the pages for (default: a desktop browser).')
+    parser.add_argument('--brotli-quality', type=int, default=BROTLI_QUALITY, choices=range(12), metavar='0-11', help='Quality of the brotli compressed files (default: %(default)s).')
+    add_blog_arguments(parser)
+    args = parser.parse_args(argv)
+
+    configure(args)
+    # static pages cannot show the experiment to some of the visitors only
+    EXPERIMENT_PROBABILITY = 0.
+    # the related posts below every post, like the server shows them
+    prepare_search(POSTS)
+    environ = {'HTTP_USER_AGENT': args.user_agent}
+    export_site(StripPathMiddleware(interface), site_paths(POSTS), args.output, workers=args.workers, environ=environ,
+                brotli_quality=args.brotli_quality)
+
+def thumbnails_main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog='app.py thumbnails',
+      description='Render all thumbnails of images referenced in the posts (like photo-300x200.jpg) in advance.')
+    parser.add_argument('--workers', '-w', type=int, help='Number of processes to render the thumbnails with.')
+    add_blog_arguments(parser)
+    args = parser.parse_args(argv)
+
+    configure(args)
+    if not THUMBNAILS.available:
+        parser.error('Rendering thumbnails requires Pillow.')
+    paths = referenced_thumbnails(POSTS.posts)
+    rendered = THUMBNAILS.generate(paths, workers=args.workers)
+    logger.info('%d thumbnails referenced, %d rendered to %s', len(paths), rendered, THUMBNAILS.cache_folder)
+
 if __name__ == '__main__':
     main()
 
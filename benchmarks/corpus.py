@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""
+Generate a synthetic blog: .mdtxt posts with paragraphs, lists, links, code blocks,
+tables and math. Tags and categories follow a Zipf-like distribution (a few are
+very common, most are rare). The same size and seed always give the same corpus.
+
+    python benchmarks/corpus.py /tmp/corpus-10k --posts 10000
+"""
+
+import os, sys, random, argparse
+from datetime import datetime, timedelta
+
+WORDS = ('the of and to in is that for it as was with be by on not he this are or his from at which but have an they you '
+         'were her she there been one all we their has would when if so no will more out up into do any your what some can '
+         'only other new time could them these two may first then now my such like our over also its after most years '
+         'linux kernel python markdown server network laser optics wavelength cache render search index blog ssh sshfs '
+         'compile build package module function variable thread process memory socket request response template').split()
+LANGUAGES = ('python', 'bash', 'c', 'javascript', 'json')
+CODE = {
+  'python': ['def {w}(x):', '    return x * 2', '', 'for i in range(10):', '    print({w}(i))'],
+  'bash': ['for f in *.mdtxt; do', '  grep -c {w} "$f"', 'done'],
+  'c': ['int {w}(int x) {{', '    return x << 1;', '}}'],
+  'javascript': ['function {w}(x) {{', '  return x.map(y => y * 2);', '}}'],
+  'json': ['{{', '  "{w}": [1, 2, 3],', '  "enabled": true', '}}'],
+}
+STATUSES = ['published'] * 18 + ['draft', 'private']
+TIME_FMT = "%Y-%m-%d %H:%M:%S"
+
+
+def zipf_choice(rng, items, s=1.1):
+    weights = [1. / (rank ** s) for rank in range(1, len(items) + 1)]
+    return rng.choices(items, weights)[0]
+
+def sentence(rng, n=None):
+    words = [rng.choice(WORDS) for _ in range(n or rng.randint(6, 20))]
+    return ' '.join(words).capitalize() + '.'
+
+def paragraph(rng):
+    text = ' '.join(sentence(rng) for _ in range(rng.randint(2, 6)))
+    if rng.random() < 0.3:
+        text += ' See [{}](https://example.com/{}) for details.'.format(rng.choice(WORDS), rng.choice(WORDS))
+    if rng.random() < 0.2:
+        text += ' Inline math like $a_{} = b^2$ is common.'.format(rng.randint(1, 9))
+    if rng.random() < 0.2:
+        text += ' Use `{}()` here.'.format(rng.choice(WORDS))
+    return text
+
+def code_block(rng):
+    language = rng.choice(LANGUAGES)
+    lines = [':::' + language] + [line.format(w=rng.choice(WORDS)) for line in CODE[language]]
+    return '\n'.join('    ' + line if line else '' for line in lines)
+
+def table(rng):
+    columns = rng.randint(2, 5)
+    rows = ['| ' + ' | '.join(rng.choice(WORDS) for _ in range(columns)) + ' |',
+            '|' + '---|' * columns]
+    for _ in range(rng.randint(2, 8)):
+        rows.append('| ' + ' | '.join(str(rng.randint(0, 1000)) for _ in range(columns)) + ' |')
+    return '\n'.join(rows)
+
+def math_block(rng):
+    return '$$\n\\sum_{{i=1}}^{{{}}} x_i^2 = \\int_0^1 f(t) \\, dt\n$$'.format(rng.randint(2, 99))
+
+def bullet_list(rng):
+    return '\n'.join('* ' + sentence(rng, rng.randint(3, 10)) for _ in range(rng.randint(2, 6)))
+
+def post_text(rng, number, date, tags, categories):
+    blocks = []
+    for _ in range(rng.randint(3, 15)):
+        kind = rng.random()
+        if kind < 0.55: blocks.append(paragraph(rng))
+        elif kind < 0.7: blocks.append(code_block(rng))
+        elif kind < 0.8: blocks.append(bullet_list(rng))
+        elif kind < 0.9: blocks.append(table(rng))
+        else: blocks.append(math_block(rng))
+    status = rng.choice(STATUSES)
+    header = [
+      '# ' + sentence(rng, rng.randint(2, 8))[:-1],
+      '',
+      '* Categories: ' + ', '.join(categories),
+      '* Tags: ' + ', '.join(tags),
+      '* Creation Date: ' + date.strftime(TIME_FMT),
+    ]
+    if rng.random() < 0.3:
+        header.append('* Modification Date: ' + (date + timedelta(days=rng.randint(1, 300))).strftime(TIME_FMT))
+    header += ['* Status: ' + status, '* Slug: post-{}'.format(number)]
+    return '\n'.join(header) + '\n\n### Content\n\n' + '\n\n'.join(blocks) + '\n'
+
+def generate_corpus(folder, posts, seed=0, tags=None, categories=None):
+    """ Write a synthetic corpus of posts into folder. Returns the list of file names. """
+    rng = random.Random(seed)
+    tag_names = ['tag{}'.format(i) for i in range(tags or max(10, int(posts ** 0.5) * 2))]
+    category_names = ['Uncategorized'] + ['category{}'.format(i) for i in range(categories or max(5, int(posts ** 0.5) // 2))]
+    os.makedirs(folder, exist_ok=True)
+    start = datetime(2005, 1, 1)
+    span = (datetime(2025, 1, 1) - start).total_seconds()
+    filenames = []
+    for number in range(posts):
+        date = start + timedelta(seconds=int(rng.random() * span))
+        post_tags = sorted(set(zipf_choice(rng, tag_names) for _ in range(rng.randint(0, 5))))
+        post_categories = sorted(set(zipf_choice(rng, category_names) for _ in range(rng.randint(1, 2))))
+        filename = 'post-{:06d}.mdtxt'.format(number)
+        with open(os.path.join(folder, filename), 'w') as f:
+            f.write(post_text(rng, number, date, post_tags, post_categories))
+        filenames.append(filename)
+    return filenames
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic blog for benchmarks')
+    parser.add_argument('folder', help='The folder to write the posts to')
+    parser.add_argument('--posts', type=int, default=100, help='Number of posts (default: 100)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator (default: 0)')
+    args = parser.parse_args()
+    generate_corpus(args.folder, args.posts, args.seed)
+    print('Wrote {} posts to {}'.format(args.posts, args.folder))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""
+Measure the throughput of the blog served by app.py with an increasing number of worker processes.
+The response cache is disabled, so every request renders its page (and searches run every time).
+
+    python benchmarks/prefork.py ~/markdown_blog_posts/ --workers 1 2 4 --clients 16
+"""
+
+import os, sys, time, signal, argparse, subprocess, multiprocessing
+import http.client
+
+APP = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'app.py')
+PATHS = ['/', '/tags', '/categories', '/search/the', '/search/python%20code']
+
+
+def wait_for_server(port, timeout=60.):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('localhost', port, timeout=1)
+            connection.request('GET', '/robots.txt')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('The server did not start within {:.0f} s'.format(timeout))
+
+def client(port, paths, duration, results):
+    requests = errors = 0
+    end = time.time() + duration
+    while time.time() < end:
+        path = paths[requests % len(paths)]
+        try:
+            connection = http.client.HTTPConnection('localhost', port, timeout=10)
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            if response.status != 200: errors += 1
+        except OSError:
+            errors += 1
+        requests += 1
+    results.put((requests, errors))
+
+def measure(folder, workers, port, clients, duration, paths):
+    command = [sys.executable, APP, folder, '--port', str(port), '--workers', str(workers),
+               '--response-cache-size', '0', '--no-compression']
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server(port)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=client, args=(port, paths, duration, results)) for _ in range(clients)]
+        start = time.time()
+        for process in processes: process.start()
+        totals = [results.get() for _ in processes]
+        elapsed = time.time() - start
+        for process in processes: process.join()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+    requests = sum(requests for requests, _ in totals)
+    errors = sum(errors for _, errors in totals)
+    return requests / elapsed, errors
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the prefork serving mode of app.py')
+    parser.add_argument('folder', help='The folder of blog entries.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Numbers of worker processes to measure (default: 1 2 4).')
+    parser.add_argument('--clients', type=int, default=os.cpu_count() * 2, help='Number of concurrent client processes (default: twice the number of CPUs).')
+    parser.add_argument('--duration', type=float, default=10., help='Seconds to measure every configuration (default: 10).')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--path', action='append', help='The path(s) to request (default: {}).'.format(' '.join(PATHS)))
+    args = parser.parse_args()
+
+    print('{} CPUs, {} clients, {:.0f} s per configuration'.format(os.cpu_count(), args.clients, args.duration))
+    baseline = None
+    for workers in args.workers:
+        throughput, errors = measure(args.folder, workers, args.port, args.clients, args.duration, args.path or PATHS)
+        baseline = baseline or throughput / workers
+        print('{:3d} workers: {:8.1f} requests/s ({:.2f}x of linear scaling), {} errors'.format(
+              workers, throughput, throughput / (baseline * workers), errors))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+"""
+Compare the current single pass render pipeline of posts.py with the previous one
+(Markdown followed by three BeautifulSoup parse/serialize round-trips).
+
+    python benchmarks/render_pipeline.py ~/markdown_blog_posts/
+"""
+
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from bs4 import BeautifulSoup
+from markdown import markdown
+
+import posts
+
+LEGACY_MD_EXTENSIONS = [
+  'markdown.extensions.abbr',
+  'markdown.extensions.tables',
+  'markdown.extensions.codehilite',
+  'mdx_math',
+]
+LEGACY_MD_EXT_CONFIGS = {
+  'markdown.extensions.codehilite': { 'linenums': False, 'guess_lang': False},
+  'mdx_math':   { 'enable_dollar_delimiter': True, },
+}
+
+def legacy_render(text):
+    html = markdown(text, extensions=LEGACY_MD_EXTENSIONS, extension_configs=LEGACY_MD_EXT_CONFIGS)
+    soup = BeautifulSoup(html, 'html.parser')
+    for pre in soup.select('.codehilite pre'):
+        pre['class'] = 'pre-x-scrollable'
+    html = str(soup)
+    soup = BeautifulSoup(html, 'html.parser')
+    for table in soup.select('table'):
+        table['class'] = 'table table-striped'
+    html = str(soup)
+    preview = str(BeautifulSoup(' '.join(html.split(' ')[:50]) + '...', "html.parser"))
+    return html, preview
+
+def normalized(html):
+    return str(BeautifulSoup(html, 'html.parser'))
+
+def timed(func, texts, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark the render pipeline of posts.py')
+    parser.add_argument('folder', help='Folder containing the blog posts')
+    parser.add_argument('--repeat', type=int, default=3, help='Take the best of this many runs')
+    args = parser.parse_args()
+
+    texts = [post['content'] for post in posts.Posts(args.folder).posts]
+    if not texts:
+        parser.error('No posts found in ' + args.folder)
+
+    mismatches = [i for i, text in enumerate(texts)
+                  if normalized(legacy_render(text)[0]) != normalized(posts.render_markdown(text)[0])]
+
+    legacy = timed(legacy_render, texts, args.repeat)
+    current = timed(posts.render_markdown, texts, args.repeat)
+
+    print("Posts:             {}".format(len(texts)))
+    print("Legacy pipeline:   {:.3f} ms per post".format(legacy / len(texts) * 1000))
+    print("Current pipeline:  {:.3f} ms per post".format(current / len(texts) * 1000))
+    print("Speedup:           {:.2f}x".format(legacy / current))
+    print("Differing content: {}".format(len(mismatches)))
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+"""
+Time the main code paths of the blog on a synthetic corpus (see corpus.py): loading the
+posts (with and without a manifest), parse_post(), Post.render(), building the search
+index, the searches and every route of the WSGI app, called in-process. Results are
+written as JSON and can be compared with a previous run:
+
+    python benchmarks/suite.py --posts 1000 --output before.json
+    (change something)
+    python benchmarks/suite.py --posts 1000 --output after.json --baseline before.json --threshold 0.1
+
+The exit code is 1 if any timing got slower than the baseline by more than the threshold.
+"""
+
+import os, sys, json, time, random, argparse, platform, subprocess, tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from corpus import generate_corpus
+import posts as posts_module
+from responsecache import LRUCache
+import app
+
+SEARCH_PHRASES = ['linux', 'render cache', 'the kernel module', 'wavelength optics laser']
+
+
+def best_of(repeat, func, number=1):
+    """ Return the shortest time of repeat runs of func() (divided by number) in seconds """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def request(wsgi_app, path):
+    from export import request as export_request
+    path, _, query = path.partition('?')
+    status, _, _ = export_request(wsgi_app, path, {'HTTP_USER_AGENT': app.EXPORT_USER_AGENT, 'QUERY_STRING': query})
+    return status
+
+def sample_paths(posts):
+    """ Return a request path for every route (by rule) of the app, for the given posts """
+    post = next(post for post in posts.posts if post['address'])
+    tag = posts.tag_counts.most_common(1)[0][0]
+    category = posts.category_counts.most_common(1)[0][0]
+    year, month = post['year'], post['month']
+    return {
+      '/': '/',
+      '/page/<page:int>': '/page/2',
+      '/tags': '/tags',
+      '/categories': '/categories',
+      '/tag/<tag>': '/tag/' + tag,
+      '/tag/<tag>/page/<page:int>': '/tag/{}/page/2'.format(tag),
+      '/category/<category>': '/category/' + category,
+      '/category/<category>/page/<page:int>': '/category/{}/page/2'.format(category),
+      '/search': '/search',
+      '/search/suggest': '/search/suggest?q=' + SEARCH_PHRASES[1][:8].replace(' ', '%20'),
+      '/search/<search_phrase>': '/search/' + SEARCH_PHRASES[1].replace(' ', '%20'),
+      '/<year:int>': '/{:04d}'.format(year),
+      '/<year:int>/page/<page:int>': '/{:04d}/page/2'.format(year),
+      '/<year:int>/<month:int>': '/{:04d}/{:02d}'.format(year, month),
+      '/<year:int>/<month:int>/page/<page:int>': '/{:04d}/{:02d}/page/1'.format(year, month),
+      '/<year:int>/<month:int>/<slug>': post['address'],
+      '/latest': '/latest',
+      '/post/<id>': '/post/' + os.path.splitext(post['file'])[0],
+      '/post/<status>/<file>': '/post/{status}/{file}'.format(**post),
+      '/robots.txt': '/robots.txt',
+      '/sitemap.xml': '/sitemap.xml',
+      '/sitemap-<number:int>.xml': '/sitemap-1.xml', # only served above the limits of one sitemap
+      '/feed.xml': '/feed.xml',
+      '/tag/<tag>/feed.xml': '/tag/{}/feed.xml'.format(tag),
+      '/category/<category>/feed.xml': '/category/{}/feed.xml'.format(category),
+      '/favicon.ico': '/favicon.ico',
+      '/static/<path:path>': '/static/css/blog.css',
+      '/assets/<path:path>': '/assets/example.txt',
+      '/wp-content/uploads/<path:path>': '/wp-content/uploads/example.txt',
+    }
+
+def run_suite(folder, repeat, render_sample, requests):
+    results = {}
+    def record(name, seconds, unit='op'):
+        results[name] = seconds
+        print('{:52s} {:10.3f} ms/{}'.format(name, seconds * 1000, unit))
+
+    posts_module.RENDER_CACHE = None
+    html_cache = posts_module.HTML_CACHE
+    loaded = []
+    record('load Posts', best_of(repeat, lambda: loaded.append(posts_module.Posts(folder, manifest=False))), 'load')
+    posts_module.Posts(folder) # writes the manifest
+    record('load Posts (manifest)', best_of(repeat, lambda: loaded.append(posts_module.Posts(folder))), 'load')
+    posts = loaded[-1]
+    record('build search index', best_of(1, lambda: posts.search_index), 'build')
+    record('find related posts', best_of(1, posts.update_related), 'build')
+    def update_related():
+        posts.related_changes = set([posts.posts[0]['file']])
+        posts.update_related()
+    record('update related posts (one changed)', best_of(1, update_related), 'build')
+    texts = [open(os.path.join(folder, post['file'])).read() for post in posts.posts]
+    record('parse_post', best_of(repeat, lambda: [posts_module.parse_post(text) for text in texts], len(texts)), 'post')
+
+    sample = random.Random(0).sample(texts, min(render_sample, len(texts)))
+    # time rendering, not the lookup of the posts rendered by the previous run
+    posts_module.HTML_CACHE = LRUCache(0)
+    def render():
+        for text in sample:
+            posts_module.parse_post(text).render()
+    parse_time = best_of(repeat, lambda: [posts_module.parse_post(text) for text in sample], len(sample))
+    record('Post.render', best_of(repeat, render, len(sample)) - parse_time, 'post')
+    def render_previews():
+        for text in sample:
+            posts_module.parse_post(text).rendered_preview
+    record('Post.rendered_preview', best_of(repeat, render_previews, len(sample)) - parse_time, 'post')
+
+    posts_module.HTML_CACHE = html_cache
+
+    for phrase in SEARCH_PHRASES:
+        record('search ' + phrase, best_of(repeat, lambda: posts.search(phrase)), 'search')
+        record('search_literally ' + phrase, best_of(repeat, lambda: posts.search_literally(phrase)), 'search')
+
+    # the app without the response cache and compression
+    args = argparse.ArgumentParser()
+    app.add_blog_arguments(args)
+    app.configure(args.parse_args([folder, '--baselink', 'http://localhost', '--favicon', os.path.join(folder, 'assets', 'example.txt')]))
+    app.WARMED_UP.set()
+    wsgi_app = app.StripPathMiddleware(app.interface)
+    paths = sample_paths(app.POSTS)
+    for route in app.interface.routes:
+        path = paths.get(route.rule)
+        if path is None:
+            print('{:52s} not measured, no sample path known'.format('route ' + route.rule))
+            continue
+        status = request(wsgi_app, path)
+        if not status[:1] in ('2', '3'):
+            print('{:52s} not measured, {} returned {}'.format('route ' + route.rule, path, status))
+            continue
+        record('route ' + route.rule, best_of(repeat, lambda: [request(wsgi_app, path) for _ in range(requests)], requests), 'request')
+    return results
+
+def metadata(posts):
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+      'posts': posts,
+      'commit': commit,
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def compare(results, baseline, threshold, min_difference):
+    """ Print the changes against the baseline results, return the names of the regressions """
+    regressions = []
+    print()
+    print('{:52s} {:>10s} {:>10s} {:>8s}'.format('', 'baseline', 'current', 'change'))
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        change = seconds / before - 1 if before else 0.
+        regression = change > threshold and seconds - before > min_difference
+        if regression: regressions.append(name)
+        print('{:52s} {:8.3f}ms {:8.3f}ms {:+7.1f}%{}'.format(name, before * 1000, seconds * 1000, change * 100, '  REGRESSION' if regression else ''))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the blog on a synthetic corpus')
+    parser.add_argument('--posts', type=int, default=1000, help='Number of posts of the generated corpus (default: 1000)')
+    parser.add_argument('--corpus', help='Folder of the corpus, generated if it does not contain any posts (default: a temporary folder)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the corpus generator (default: 0)')
+    parser.add_argument('--repeat', type=int, default=3, help='Take the best of this many runs (default: 3)')
+    parser.add_argument('--render-sample', type=int, default=200, help='Number of posts to time rendering with (default: 200)')
+    parser.add_argument('--requests', type=int, default=10, help='Requests per run for every route (default: 10)')
+    parser.add_argument('--output', '-o', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare with the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Relative slowdown counted as a regression (default: 0.1)')
+    parser.add_argument('--min-difference', type=float, default=0.05, help='Ignore slowdowns of less than this many milliseconds (default: 0.05)')
+    args = parser.parse_args()
+
+    # the static route serves files relative to the working directory
+    os.chdir(ROOT)
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.corpus or os.path.join(tmp, 'corpus')
+        if not os.path.isdir(folder) or not any(name.endswith('.' + posts_module.FILE_EXTENSION) for name in os.listdir(folder)):
+            start = time.time()
+            generate_corpus(folder, args.posts, args.seed)
+            print('Generated {} posts in {:.1f} s'.format(args.posts, time.time() - start))
+        os.makedirs(os.path.join(folder, 'assets'), exist_ok=True)
+        with open(os.path.join(folder, 'assets', 'example.txt'), 'w') as f:
+            f.write('An example media file.\n')
+        posts = len([name for name in os.listdir(folder) if name.endswith('.' + posts_module.FILE_EXTENSION)])
+        results = run_suite(folder, args.repeat, args.render_sample, args.requests)
+
+    document = {'meta': metadata(posts), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=1, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('posts') != posts:
+            print('Warning: the baseline was measured with {} posts, not {}'.format(baseline['meta'].get('posts'), posts))
+        regressions = compare(results, baseline['results'], args.threshold, args.min_difference / 1000.)
+        if regressions:
+            print('{} regression(s) of more than {:.0f}%'.format(len(regressions), args.threshold * 100))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+Content-Encoding negotiation for responses of the blog.
+
+* CompressionMiddleware compresses responses of textual types above a minimum size on the fly.
+  Compressed variants of responses with an ETag (like those of the response cache) are kept
+  in memory, so every page is compressed only once per encoding.
+* static_file_compressed() serves precompressed .br/.gz siblings of static files and
+  generates (and keeps) them in a cache folder where they do not exist. The cache folder
+  is only used if no other user can write to it.
+"""
+
+import os, gzip, stat, shutil, atexit, logging, tempfile, threading, mimetypes
+
+from bottle import request, static_file
+
+from responsecache import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'application/atom+xml', 'image/svg+xml')
+# preferred encoding first
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+FILE_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+logger = logging.getLogger(__name__)
+
+_private_folder = None
+_private_folder_lock = threading.Lock()
+_untrusted_folders = set() # warned about
+
+
+def compress(data, encoding, fast=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5 if fast else 11)
+    return gzip.compress(data, 6 if fast else 9, mtime=0)
+
+def negotiate(accept_encoding, encodings=ENCODINGS):
+    """ Return the best of the encodings acceptable according to the Accept-Encoding header (or None) """
+    qualities = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name: continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[name] = q
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = qualities.get(encoding, qualities.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+def is_compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+def _add_vary(headers, value='Accept-Encoding'):
+    for i, (name, existing) in enumerate(headers):
+        if name.lower() == 'vary':
+            if value.lower() not in existing.lower():
+                headers[i] = (name, existing + ', ' + value)
+            return headers
+    headers.append(('Vary', value))
+    return headers
+
+
+class CompressionMiddleware(object):
+    """ Compress responses of compressible types larger than min_size according to the Accept-Encoding of the request """
+
+    def __init__(self, app, min_size=1024, max_cache_bytes=16*1024*1024):
+        self.app = app
+        self.min_size = min_size
+        self.cache = LRUCache(max_cache_bytes)
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] != 'GET':
+            return self.app(environ, start_response)
+        encoding = negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+        if not encoding:
+            def add_vary(status, headers, exc_info=None):
+                content_type = dict((name.lower(), value) for name, value in headers).get('content-type', '')
+                if is_compressible(content_type): _add_vary(headers)
+                return start_response(status, headers, exc_info)
+            return self.app(environ, add_vary)
+        suffix = '-' + encoding + '"'
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        revalidating = bool(if_none_match) and suffix in if_none_match
+        if revalidating:
+            # the ETags of compressed representations carry the encoding, the app does not know about them
+            environ['HTTP_IF_NONE_MATCH'] = if_none_match.replace(suffix, '"')
+
+        captured = []
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            return lambda data: captured.append(data)
+        result = self.app(environ, capture)
+        status, headers, exc_info = captured[:3]
+        header_dict = dict((name.lower(), value) for name, value in headers)
+        etag = header_dict.get('etag')
+        if status.startswith('304') and etag and (revalidating or not if_none_match) and etag.endswith('"'):
+            headers = [(name, value[:-1] + suffix if name.lower() == 'etag' else value) for name, value in headers]
+            start_response(status, _add_vary(headers), exc_info)
+            return result
+        if (not status.startswith('200') or 'content-encoding' in header_dict
+                or not is_compressible(header_dict.get('content-type', ''))):
+            start_response(status, headers, exc_info)
+            return result
+
+        try:
+            body = b''.join(captured[3:]) + b''.join(result)
+        finally:
+            if hasattr(result, 'close'): result.close()
+        if len(body) < self.min_size:
+            start_response(status, _add_vary(list(headers)), exc_info)
+            return [body]
+        compressed = self.cache.get((etag, encoding)) if etag else None
+        if compressed is None:
+            compressed = compress(body, encoding, fast=True)
+            if etag: self.cache.put((etag, encoding), compressed)
+        headers = [(name, value[:-1] + suffix if name.lower() == 'etag' else value)
+                   for name, value in headers if name.lower() != 'content-length']
+        headers += [('Content-Encoding', encoding), ('Content-Length', str(len(compressed)))]
+        start_response(status, _add_vary(headers), exc_info)
+        return [compressed]
+
+
+def private_cache_folder():
+    """ Return a temporary folder of this process (created on first use, removed at exit) """
+    global _private_folder
+    with _private_folder_lock:
+        if _private_folder is None:
+            _private_folder = tempfile.mkdtemp(prefix='local-blog-static-')
+            atexit.register(shutil.rmtree, _private_folder, True)
+        return _private_folder
+
+def _check_folder(folder):
+    """ Raise PermissionError unless folder belongs to the current user and nobody else can write to it """
+    st = os.stat(folder)
+    if (hasattr(os, 'getuid') and st.st_uid != os.getuid()) or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        if folder not in _untrusted_folders:
+            _untrusted_folders.add(folder)
+            logger.warning('Not using the cache folder %s: it belongs to another user or others can write to it', folder)
+        raise PermissionError('Untrusted cache folder ' + folder)
+
+def _compressed_file(filename, root, encoding, cache_folder):
+    """ Return (root, filename) of the compressed variant of a file, creating it in cache_folder if needed """
+    suffix = FILE_SUFFIXES[encoding]
+    source = os.path.join(root, filename)
+    if os.path.isfile(source + suffix):
+        return root, filename + suffix
+    # others could plant files there which would be served instead of the static files
+    os.makedirs(cache_folder, mode=0o700, exist_ok=True)
+    _check_folder(cache_folder)
+    cached = os.path.join(cache_folder, filename + suffix)
+    if not os.path.isfile(cached) or os.path.getmtime(cached) < os.path.getmtime(source):
+        with open(source, 'rb') as f:
+            data = compress(f.read(), encoding)
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cached))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, cached)
+    return cache_folder, filename + suffix
+
+def static_file_compressed(filename, root, cache_folder=None, **kwargs):
+    """
+    Like bottle.static_file(), but serve a compressed variant of the file if the client accepts one.
+    Variants are generated in cache_folder, by default in private_cache_folder().
+    """
+    mimetype = kwargs.pop('mimetype', None) or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    source = os.path.abspath(os.path.join(root, filename.strip('/\\')))
+    if not is_compressible(mimetype) or not source.startswith(os.path.abspath(root) + os.sep) or not os.path.isfile(source):
+        return static_file(filename, root=root, mimetype=mimetype, **kwargs)
+    encoding = negotiate(request.environ.get('HTTP_ACCEPT_ENCODING'))
+    if encoding:
+        try:
+            compressed_root, compressed_filename = _compressed_file(os.path.relpath(source, os.path.abspath(root)), root, encoding,
+                                                                   cache_folder or private_cache_folder())
+        except OSError:
+            encoding = None
+    if encoding:
+        response = static_file(compressed_filename, root=compressed_root, mimetype=mimetype, **kwargs)
+        response.set_header('Content-Encoding', encoding)
+    else:
+        response = static_file(filename, root=root, mimetype=mimetype, **kwargs)
+    response.set_header('Vary', 'Accept-Encoding')
+    return response
@@ -0,0 +1,156 @@
+"""
+Export the pages of a WSGI application into a folder to be served by a static web server.
+
+Every page of a textual type is written together with a gzip and (if the brotli package
+is installed) a brotli compressed variant, e.g. for nginx' gzip_static and brotli_static.
+A manifest of the exported pages allows re-exports to skip writing unchanged pages (they
+are all rendered again) and to delete pages that no longer exist.
+"""
+
+import os, io, sys, gzip, json, hashlib, logging, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from compression import is_compressible
+
+logger = logging.getLogger(__name__)
+
+BROTLI_QUALITY = 9 # 11, the maximum, takes several times as long for a few percent
+MANIFEST = '.export-manifest.json'
+INDEX_FILE = 'index.html'
+
+# set in the worker processes (inherited when forking)
+_app = None
+_environ = None
+_brotli_quality = BROTLI_QUALITY
+
+
+def file_for_path(path, content_type):
+    """ Return the file (relative to the export folder) a request path is exported to """
+    path = path.strip('/')
+    if content_type.startswith('text/html'):
+        return os.path.join(path, INDEX_FILE)
+    # sitemap.xml, robots.txt, ...
+    return path
+
+def request(app, path, environ=None):
+    """ Return the status, the Content-Type and the body of a GET request to the WSGI app """
+    env = {
+      'REQUEST_METHOD': 'GET',
+      'SCRIPT_NAME': '',
+      'PATH_INFO': path,
+      'QUERY_STRING': '',
+      'SERVER_NAME': 'localhost',
+      'SERVER_PORT': '80',
+      'SERVER_PROTOCOL': 'HTTP/1.1',
+      'wsgi.version': (1, 0),
+      'wsgi.url_scheme': 'http',
+      'wsgi.input': io.BytesIO(),
+      'wsgi.errors': sys.stderr,
+      'wsgi.multithread': False,
+      'wsgi.multiprocess': True,
+      'wsgi.run_once': False,
+    }
+    env.update(environ or {})
+    response = []
+    def start_response(status, headers, exc_info=None):
+        response[:] = [status, dict((name.lower(), value) for name, value in headers)]
+    result = app(env, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'): result.close()
+    status, headers = response
+    return status, headers.get('content-type', 'text/html'), body
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def export_page(output_folder, path, known):
+    """ Render and write one page. Returns (path, file, digest, written, error). """
+    file = None
+    try:
+        status, content_type, body = request(_app, path, _environ)
+        if not status.startswith('200'):
+            return path, file, None, False, 'HTTP ' + status
+        file = file_for_path(path, content_type)
+        digest = hashlib.sha256(body).hexdigest()
+        target = os.path.join(output_folder, file)
+        # a path like /tag/.. would overwrite other pages
+        if (os.path.isabs(file) or os.path.normpath(file) != file
+                or not os.path.realpath(target).startswith(os.path.realpath(output_folder) + os.sep)):
+            return path, None, None, False, 'Not writing the page outside of its folder: ' + file
+        if [file, digest] == known and os.path.exists(target):
+            return path, file, digest, False, None
+        write_file(target, body)
+        if is_compressible(content_type):
+            write_file(target + '.gz', gzip.compress(body, 9, mtime=0))
+            if brotli:
+                write_file(target + '.br', brotli.compress(body, quality=_brotli_quality))
+        return path, file, digest, True, None
+    except Exception as e:
+        return path, file, None, False, str(e)
+
+def _init_worker(app, environ, brotli_quality=BROTLI_QUALITY):
+    global _app, _environ, _brotli_quality
+    _app, _environ, _brotli_quality = app, environ, brotli_quality
+
+def export_site(app, paths, output_folder, workers=None, environ=None, brotli_quality=BROTLI_QUALITY):
+    """
+    Export the pages at the given request paths of the WSGI app into output_folder,
+    using a pool of worker processes if workers > 1. Returns the number of pages written.
+    """
+    if not brotli:
+        logger.warning('The brotli package is not installed, exporting without brotli compressed files.')
+    os.makedirs(output_folder, exist_ok=True)
+    manifest_path = os.path.join(output_folder, MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    paths = list(dict.fromkeys(paths))
+    jobs = [(output_folder, path, manifest.get(path)) for path in paths]
+    if workers and workers > 1:
+        # the worker processes inherit the configured application by forking
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(app, environ, brotli_quality)) as executor:
+            results = list(executor.map(export_page, *zip(*jobs), chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        _init_worker(app, environ, brotli_quality)
+        results = [export_page(*job) for job in jobs]
+
+    new_manifest = {}
+    written = 0
+    for path, file, digest, was_written, error in results:
+        if error:
+            logger.warning('Could not export the page %s for the following reason:', path)
+            logger.warning(error)
+            # keep what was exported before
+            if path in manifest: new_manifest[path] = manifest[path]
+            continue
+        new_manifest[path] = [file, digest]
+        written += was_written
+
+    current_files = set(file for file, _ in new_manifest.values())
+    for file, _ in manifest.values():
+        if file in current_files: continue
+        for suffix in ('', '.gz', '.br'):
+            try:
+                os.remove(os.path.join(output_folder, file + suffix))
+            except OSError:
+                pass
+
+    write_file(manifest_path, json.dumps(new_manifest, indent=1, sort_keys=True).encode('utf-8'))
+    logger.info('Exported %d pages to %s (%d changed, %d removed)', len(new_manifest), output_folder,
+                written, len(set(manifest) - set(new_manifest)))
+    return written
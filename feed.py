@@ -0,0 +1,87 @@
+"""
+Atom feeds (RFC 4287) of the blog, built as bytes once per content generation.
+
+The XML of an entry only depends on its post file, so entries are cached by
+the digest of the file: a new generation re-serializes just the entries of
+changed posts and joins the rest.
+"""
+
+import hashlib
+from datetime import datetime
+from xml.sax.saxutils import escape, quoteattr
+
+from responsecache import LRUCache
+
+ENTRY_CACHE_BYTES = 16 * 1024 * 1024
+XML_DECLARATION = "<?xml version='1.0' encoding='UTF-8'?>\n"
+
+
+def atom_date(date):
+    """ RFC 3339 date of a naive datetime in local time """
+    return date.astimezone().isoformat()
+
+def timestamp(date):
+    return date.timestamp() if date else 0.
+
+
+class Feed(object):
+    """ A complete feed document, its ETag and the time it was last modified (a timestamp) """
+
+    def __init__(self, data, last_modified):
+        self.data = data
+        self.etag = '"{}"'.format(hashlib.sha1(data).hexdigest())
+        self.last_modified = last_modified
+
+
+class AtomFeeds(object):
+    """
+    Builds the feeds of a blog found at baselink. link(post) returns the path of a post.
+    With previews set, entries carry the previews of posts instead of their full content.
+    """
+
+    def __init__(self, baselink, title, author, link, previews=False):
+        self.baselink = baselink
+        self.title = title
+        self.author = author
+        self.link = link
+        self.previews = previews
+        self.entries = LRUCache(ENTRY_CACHE_BYTES) # (file, digest of the file) -> XML of the entry
+
+    def entry(self, post):
+        """ Return the XML of the entry of a post """
+        key = (post['file'], post.digest)
+        cached = self.entries.get(key)
+        if cached is not None:
+            return cached
+        url = self.baselink + self.link(post)
+        if self.previews:
+            body = '<summary type="html">{}</summary>'.format(escape(post.rendered_preview))
+        else:
+            body = '<content type="html">{}</content>'.format(escape(post.rendered_content))
+        parts = ['<entry>',
+                 '<title>{}</title>'.format(escape(post['title'])),
+                 '<link rel="alternate" type="text/html" href={}/>'.format(quoteattr(url)),
+                 '<id>{}</id>'.format(escape(url)),
+                 '<published>{}</published>'.format(atom_date(post['creation_date'])),
+                 '<updated>{}</updated>'.format(atom_date(post['modification_date']))]
+        parts += ['<category term={}/>'.format(quoteattr(term)) for term in post['categories'] + post['tags']]
+        parts += [body, '</entry>\n']
+        xml = ''.join(parts).encode('utf-8')
+        self.entries.put(key, xml)
+        return xml
+
+    def build(self, path, subtitle, posts):
+        """ Return the Feed (served at path) of the given posts, newest first """
+        url = self.baselink + path
+        updated = max((post['modification_date'] for post in posts), default=datetime.now())
+        title = self.title + (' - ' + subtitle if subtitle else '')
+        head = [XML_DECLARATION,
+                '<feed xmlns="http://www.w3.org/2005/Atom" xml:base={}>\n'.format(quoteattr(self.baselink + '/')),
+                '<title>{}</title>\n'.format(escape(title)),
+                '<id>{}</id>\n'.format(escape(url)),
+                '<link rel="self" type="application/atom+xml" href={}/>\n'.format(quoteattr(url)),
+                '<link rel="alternate" type="text/html" href={}/>\n'.format(quoteattr(self.baselink + '/')),
+                '<updated>{}</updated>\n'.format(atom_date(updated)),
+                '<author><name>{}</name></author>\n'.format(escape(self.author))]
+        data = ''.join(head).encode('utf-8') + b''.join(self.entry(post) for post in posts) + b'</feed>\n'
+        return Feed(data, timestamp(updated))
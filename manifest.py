@@ -0,0 +1,79 @@
+"""
+A manifest of the parsed posts, kept in the posts folder so that they need not all be
+read and parsed again at every start.
+
+Entries are keyed by the file name and are valid as long as the modification time and
+the size of the file are unchanged. Files modified shortly before the manifest was
+written are read again anyway: a change within the resolution of the file system's
+timestamps would go unnoticed otherwise.
+"""
+
+import os, json, time, logging, tempfile
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = '.posts-manifest.json'
+RACY_SECONDS = 2.
+
+
+class Manifest(object):
+    """ Records (JSON serializable values) of the files in folder. Entries written by another version are ignored. """
+
+    def __init__(self, folder, version):
+        self.path = os.path.join(folder, MANIFEST_FILE)
+        self.version = version
+        self.entries = {} # file name -> [mtime in ns, size, record]
+        self.written = 0.
+        self.changed = False
+        try:
+            with open(self.path, 'rb') as f:
+                data = json.loads(f.read().decode('utf-8'))
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning('Ignoring the unreadable manifest %s: %s', self.path, e)
+            return
+        if data.get('version') == version:
+            self.entries = data.get('files', {})
+            self.written = data.get('written', 0.)
+
+    def get(self, filename, stat):
+        """ Return the record of the file with the given os.stat() result if it is up to date, otherwise None """
+        entry = self.entries.get(filename)
+        if entry is None or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+            return None
+        if stat.st_mtime > self.written - RACY_SECONDS:
+            return None
+        return entry[2]
+
+    def put(self, filename, stat, record):
+        self.entries[filename] = [stat.st_mtime_ns, stat.st_size, record]
+        self.changed = True
+
+    def retain(self, filenames):
+        """ Drop the entries of all files but the given ones """
+        filenames = set(filenames)
+        for filename in [name for name in self.entries if name not in filenames]:
+            del self.entries[filename]
+            self.changed = True
+
+    def save(self):
+        """ Write the manifest if it changed """
+        if not self.changed:
+            return
+        self.written = time.time()
+        data = json.dumps({'version': self.version, 'written': self.written, 'files': self.entries}, separators=(',', ':'))
+        folder = os.path.dirname(self.path)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=MANIFEST_FILE, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data.encode('utf-8'))
+                os.replace(tmp_path, self.path)
+            except OSError:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning('Could not write the manifest %s: %s', self.path, e)
+            return
+        self.changed = False
@@ -0,0 +1,235 @@
+"""
+Markdown extensions rewriting the element tree of a post while it is rendered.
+
+They replace separate parse/serialize round-trips of the finished HTML:
+
+* BootstrapExtension gives tables and highlighted code blocks the classes the templates expect.
+* PreviewExtension keeps a copy of the tree truncated after a number of words.
+  After converting a post, serialize(md, md.preview_root) returns the HTML of its preview.
+  leading_markdown() cuts the Markdown source of a post down to what its preview needs.
+"""
+
+import re, copy
+
+from markdown.extensions import Extension
+from markdown.treeprocessors import Treeprocessor
+from markdown.util import HTML_PLACEHOLDER_RE
+
+from metrics import stage
+
+TABLE_CLASS = 'table table-striped'
+PRE_CLASS = 'pre-x-scrollable'
+ELLIPSIS = '...'
+
+# Elements whose content is never cut in half by a preview: math and code
+ATOMIC_TAGS = ('script', 'pre')
+
+CODEHILITE_PRE_RE = re.compile(r'(?P<prefix><div class="codehilite"[^>]*>\s*)<pre\b(?P<attributes>[^>]*)>')
+TABLE_RE = re.compile(r'<table\b(?P<attributes>[^>]*)>')
+CLASS_ATTR_RE = re.compile(r'''\s+class\s*=\s*("[^"]*"|'[^']*'|[^\s>]+)''')
+WORD_RE = re.compile(r'\S+')
+BLANK_LINES_RE = re.compile(r'\n(?:[ \t]*\n)+')
+# link references ([id]: url) and abbreviations (*[HTML]: ...) may be defined anywhere in the text
+DEFINITION_RE = re.compile(r'^ {0,3}\*?\[[^\]]+\]:.*$', re.MULTILINE)
+# blocks which may contain blank lines
+FENCES = ('$$', '```', '~~~')
+# Markdown rendered as one atomic element (math, fenced code), counted as one word like in truncate_tree()
+ATOMIC_SOURCE_RE = re.compile(r'```.*?```|~~~.*?~~~|\\begin\{.*?\\end\{[^}]*\}|\$\$.*?\$\$|\\\[.*?\\\]|\$[^$]+\$|\\\(.*?\\\)', re.DOTALL)
+# Markdown not shown as words: images, link targets and inline HTML tags
+HIDDEN_SOURCE_RE = re.compile(r'!\[[^\]]*\]\([^)]*\)|!\[[^\]]*\]\[[^\]]*\]|\]\([^)]*\)|<[^>\n]*>')
+# indented code blocks, rendered as one atomic <pre> element (or as part of a list item)
+INDENTED_LINE_RE = re.compile(r'^(?: {4}|\t).*$', re.MULTILINE)
+# a word of the text (and not just markup like list bullets, heading or table marks)
+SOURCE_WORD_RE = re.compile(r'\S*\w\S*')
+# raw HTML blocks, which may contain blank lines and are rendered as one stashed block
+HTML_BLOCK_RE = re.compile(r'^ {0,3}<[A-Za-z!?/]', re.MULTILINE)
+
+
+def _replace_class(tag, cls):
+    def replace(match):
+        attributes = CLASS_ATTR_RE.sub('', match.group('attributes'))
+        prefix = match.groupdict().get('prefix') or ''
+        return '{}<{} class="{}"{}>'.format(prefix, tag, cls, attributes)
+    return replace
+
+def restyle_html(html):
+    """ Apply the Bootstrap classes to raw HTML (as stashed by Markdown for highlighted code and inline HTML) """
+    if '<pre' in html:
+        html = CODEHILITE_PRE_RE.sub(_replace_class('pre', PRE_CLASS), html)
+    if '<table' in html:
+        html = TABLE_RE.sub(_replace_class('table', TABLE_CLASS), html)
+    return html
+
+
+class BootstrapTreeprocessor(Treeprocessor):
+
+    def run(self, root):
+        with stage('postprocess'):
+            for table in root.iter('table'):
+                table.set('class', TABLE_CLASS)
+            # highlighted code is not part of the tree but stashed as raw HTML by codehilite
+            blocks = self.md.htmlStash.rawHtmlBlocks
+            for i, block in enumerate(blocks):
+                if isinstance(block, str):
+                    blocks[i] = restyle_html(block)
+
+class BootstrapExtension(Extension):
+
+    def extendMarkdown(self, md):
+        # after the code blocks have been highlighted (30) and inline HTML was stashed (20)
+        md.treeprocessors.register(BootstrapTreeprocessor(md), 'bootstrap', 5)
+        md.registerExtension(self)
+
+
+def _cut_text(text, budget):
+    """ Return the text cut after budget[0] words (and whether it was cut), consuming the budget """
+    if not text:
+        return text, False
+    words = list(WORD_RE.finditer(text))
+    if len(words) <= budget[0]:
+        budget[0] -= len(words)
+        return text, False
+    end = words[budget[0] - 1].end() if budget[0] else 0
+    budget[0] = 0
+    return text[:end], True
+
+def _is_empty(element):
+    return not len(element) and not (element.text or '').strip()
+
+def _truncate(element, budget):
+    """ Drop everything after budget[0] words from the element, return whether anything was dropped """
+    if element.tag in ATOMIC_TAGS:
+        if not budget[0]:
+            return True
+        budget[0] -= 1
+        return False
+    element.text, cut = _cut_text(element.text, budget)
+    if cut:
+        del element[:]
+        return True
+    for i, child in enumerate(element):
+        if _truncate(child, budget):
+            if child.tag in ATOMIC_TAGS or _is_empty(child):
+                del element[i:]
+            else:
+                child.tail = None
+                del element[i + 1:]
+            return True
+        child.tail, cut = _cut_text(child.tail, budget)
+        if cut:
+            del element[i + 1:]
+            return True
+    return False
+
+def _is_block_placeholder(element):
+    # a block of raw HTML (like highlighted code) stashed by Markdown in place of the element
+    return not len(element) and element.text is not None and HTML_PLACEHOLDER_RE.fullmatch(element.text.strip())
+
+def _append_ellipsis(element):
+    """ Append the ellipsis to the last piece of text inside the element """
+    for child in reversed(element):
+        if (child.tail or '').strip():
+            child.tail = child.tail.rstrip() + ELLIPSIS
+            return True
+        if child.tag in ATOMIC_TAGS or _is_block_placeholder(child):
+            child.tail = ELLIPSIS
+            return True
+        if _append_ellipsis(child):
+            return True
+    if (element.text or '').strip():
+        element.text = element.text.rstrip() + ELLIPSIS
+        return True
+    return False
+
+def truncate_tree(root, words):
+    """ Cut the element tree in place after the given number of words and mark the end with an ellipsis """
+    _truncate(root, [words])
+    if not _append_ellipsis(root):
+        root.text = ELLIPSIS
+    return root
+
+
+class PreviewTreeprocessor(Treeprocessor):
+
+    def __init__(self, md, words):
+        super(PreviewTreeprocessor, self).__init__(md)
+        self.words = words
+
+    def run(self, root):
+        with stage('postprocess'):
+            self.md.preview_root = truncate_tree(copy.deepcopy(root), self.words)
+
+class PreviewExtension(Extension):
+
+    def __init__(self, **kwargs):
+        self.config = {
+          'words': [50, 'The number of words to keep in the preview'],
+        }
+        super(PreviewExtension, self).__init__(**kwargs)
+
+    def extendMarkdown(self, md):
+        self.md = md
+        md.preview_root = None
+        # last of all tree processors: after unescaping (0)
+        md.treeprocessors.register(PreviewTreeprocessor(md, self.getConfig('words')), 'preview', -10)
+        md.registerExtension(self)
+
+    def reset(self):
+        self.md.preview_root = None
+
+
+def count_words(markdown_text):
+    """
+    Count the words of Markdown text as truncate_tree() counts them in its HTML, or fewer: math
+    and code blocks count as one word, markup, link targets, images and definitions as none.
+    """
+    text = DEFINITION_RE.sub(' ', markdown_text)
+    text = INDENTED_LINE_RE.sub(' ', text)
+    text = ATOMIC_SOURCE_RE.sub(' _ ', text)
+    text = HIDDEN_SOURCE_RE.sub(' ', text)
+    return len(SOURCE_WORD_RE.findall(text))
+
+def leading_markdown(text, words, extra_blocks=1):
+    """
+    Return the leading blocks of the Markdown text holding (at least) the given number of words,
+    followed by the link and abbreviation definitions of the whole text. Words are counted by
+    count_words(), never more than the HTML has, so its preview is cut within the leading blocks
+    and renders like the preview of the whole text. The text is only cut at blank lines which
+    are not inside of fenced blocks and not followed by indented lines (code, list items).
+    Text with raw HTML blocks (which may span blank lines) is returned whole.
+    """
+    if HTML_BLOCK_RE.search(text):
+        return text
+    count = 0
+    counted = 0 # the words before this position are counted
+    blocks = 0
+    for match in BLANK_LINES_RE.finditer(text):
+        head = text[:match.start()]
+        start = match.end()
+        if text[start:start + 1] in (' ', '\t') or any(head.count(fence) % 2 for fence in FENCES):
+            continue
+        if count < words:
+            count += count_words(text[counted:match.start()])
+            counted = start
+            if count < words:
+                continue
+        blocks += 1
+        if blocks > extra_blocks:
+            definitions = DEFINITION_RE.findall(text, match.start())
+            return head + '\n\n' + '\n'.join(definitions) if definitions else head
+    return text
+
+
+def serialize(md, root):
+    """ Serialize an element tree the way Markdown.convert() does it for the document """
+    output = md.serializer(root)
+    if md.stripTopLevelTags:
+        start = output.find('<%s>' % md.doc_tag)
+        end = output.rfind('</%s>' % md.doc_tag)
+        if start == -1 or end == -1:
+            output = ''
+        else:
+            output = output[start + len(md.doc_tag) + 2:end].strip()
+    for pp in md.postprocessors:
+        output = pp.run(output)
+    return output.strip()
@@ -0,0 +1,231 @@
+"""
+Request timing and counters, exposed in the Prometheus text format.
+
+MetricsMiddleware times every request by route and reports its response size. Code
+handling a request marks stages of its work with `with stage('name'):`. The time of
+a stage excludes the stages nested in it, e.g. 'template' does not include a
+'markdown' render triggered by the template. Stages are observed in a histogram
+and, for the current request, summed up for the slow request log.
+
+With several worker processes, every process keeps (and reports) its own metrics.
+"""
+
+import time, logging, threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+    return '{' + ','.join('{}="{}"'.format(name, escape(value)) for name, value in pairs) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter(object):
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def expose(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} counter'.format(self.name)]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append('{}{} {}'.format(self.name, _format_labels(self.labelnames, labels), _format_value(value)))
+        return lines
+
+class Histogram(object):
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {} # labels -> [counts per bucket (not cumulative), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0., 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def expose(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} histogram'.format(self.name)]
+        with self._lock:
+            values = sorted((labels, [list(entry[0]), entry[1], entry[2]]) for labels, entry in self._values.items())
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{} {}'.format(self.name, _format_labels(self.labelnames, labels, [('le', _format_value(bound))]), cumulative))
+            lines.append('{}_sum{} {}'.format(self.name, _format_labels(self.labelnames, labels), _format_value(total)))
+            lines.append('{}_count{} {}'.format(self.name, _format_labels(self.labelnames, labels), count))
+        return lines
+
+class Callback(object):
+    """ A metric whose samples [(label values, value), ...] are returned by a function when exposed """
+
+    def __init__(self, name, help, type, labelnames, func):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labelnames = labelnames
+        self.func = func
+
+    def expose(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.type)]
+        for labels, value in self.func():
+            lines.append('{}{} {}'.format(self.name, _format_labels(self.labelnames, labels), _format_value(value)))
+        return lines
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def expose(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines += metric.expose()
+            except Exception:
+                logger.exception('Could not collect the metric %s', metric.name)
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram('localblog_stage_duration_seconds',
+  'Time spent in a stage of handling requests (excluding nested stages)', ('stage',)))
+RENDERS = REGISTRY.register(Counter('localblog_renders_total',
+  'Posts rendered (full posts or previews only)', ('kind',)))
+
+
+_local = threading.local()
+
+@contextmanager
+def stage(name):
+    """ Time the enclosed code as the stage name (of the current request, if any) """
+    stack = _local.__dict__.setdefault('stack', [])
+    stack.append(0.)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        exclusive = elapsed - stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        STAGE_SECONDS.observe((name,), exclusive)
+        stages = getattr(_local, 'stages', None)
+        if stages is not None:
+            stages[name] = stages.get(name, 0.) + exclusive
+
+
+class _ObservedResponse(object):
+    """ Pass the response body through, counting its size, and record the request when it is closed """
+
+    def __init__(self, result, on_close):
+        self.result = result
+        self.on_close = on_close
+        self.size = 0
+
+    def __iter__(self):
+        for data in self.result:
+            self.size += len(data)
+            yield data
+
+    def close(self):
+        try:
+            if hasattr(self.result, 'close'): self.result.close()
+        finally:
+            self.on_close(self.size)
+
+
+class MetricsMiddleware(object):
+    """
+    Time the requests to a WSGI app by route and serve the metrics of REGISTRY at path (unless it is None).
+    route(environ) returns the route (rule) a request was handled by. Requests taking
+    longer than slow_request seconds are logged with the time spent in every stage.
+    """
+
+    def __init__(self, app, route, path='/metrics', slow_request=None, registry=REGISTRY):
+        self.app = app
+        self.route = route
+        self.path = path
+        self.slow_request = slow_request
+        self.registry = registry
+        self.duration = registry.register(Histogram('localblog_request_duration_seconds',
+          'Time to handle a request, including sending the response', ('route',)))
+        self.size = registry.register(Histogram('localblog_response_size_bytes',
+          'Size of response bodies (as sent, i.e. after compression)', ('route',), buckets=SIZE_BUCKETS))
+        self.responses = registry.register(Counter('localblog_responses_total', 'Responses by route and status', ('route', 'status')))
+
+    def __call__(self, environ, start_response):
+        if self.path and environ.get('PATH_INFO') == self.path:
+            body = self.registry.expose().encode('utf-8')
+            start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+                                      ('Content-Length', str(len(body))), ('Cache-Control', 'no-store')])
+            return [body]
+        start = time.perf_counter()
+        method, path = environ.get('REQUEST_METHOD'), environ.get('PATH_INFO') # before the app changes them
+        _local.stages = stages = {}
+        status = []
+        length = []
+        def capture(status_line, headers, exc_info=None):
+            status[:] = [status_line.split(' ', 1)[0]]
+            length[:] = [value for name, value in headers if name.lower() == 'content-length']
+            return start_response(status_line, headers, exc_info)
+        try:
+            result = self.app(environ, capture)
+        except BaseException:
+            _local.stages = None
+            raise
+        # stages after this point (while the body is sent) are not counted for the request
+        _local.stages = None
+        def on_close(size):
+            self._record(environ, method, path, status[0] if status else '500', stages, time.perf_counter() - start, size)
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, type) and isinstance(result, file_wrapper):
+            # wrapping a file would keep the server from sending it efficiently (e.g. with sendfile):
+            # it is recorded without the time to send it, with the size of its Content-Length
+            on_close(int(length[0]) if length and length[0].isdigit() else 0)
+            return result
+        return _ObservedResponse(result, on_close)
+
+    def _record(self, environ, method, path, status, stages, duration, size):
+        route = self.route(environ)
+        self.duration.observe((route,), duration)
+        self.size.observe((route,), size)
+        self.responses.inc((route, status))
+        if self.slow_request is not None and duration >= self.slow_request:
+            breakdown = ', '.join('{} {:.1f} ms'.format(name, seconds * 1000) for name, seconds in sorted(stages.items(), key=lambda item: -item[1]))
+            logger.warning('Slow request: %s %s took %.1f ms (%s; %d bytes, status %s, route %s)',
+                           method, path, duration * 1000,
+                           breakdown or 'no stages', size, status, route)
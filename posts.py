@@ -1,14 +1,25 @@
 #!/usr/bin/env python
 
-import os, re, logging
+import os, copy, time, bisect, hashlib, logging, threading, itertools
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, date
 
-from bs4 import BeautifulSoup
-from markdown import markdown
+import markdown, pygments
+
+import mdext
+from mdext import serialize, leading_markdown, ELLIPSIS
+from metrics import stage, RENDERS
+from rendercache import content_key
+from responsecache import LRUCache
+from searchindex import SearchIndex
+from manifest import Manifest
+import related
 
 logger = logging.getLogger(__name__)
 
 FILE_EXTENSION = 'mdtxt'
+RELATED_POSTS = 5 # shown below a post
 TIME_FMT = "%Y-%m-%d %H:%M:%S"
 
 MD_EXTENSIONS = [
@@ -16,111 +27,590 @@ MD_EXTENSIONS = [
   'markdown.extensions.tables',
   'markdown.extensions.codehilite',
   'mdx_math',
+  'mdext:BootstrapExtension',
+  'mdext:PreviewExtension',
 ]
 MD_EXT_CONFIGS = {
   'markdown.extensions.codehilite': { 'linenums': False, 'guess_lang': False},
   'mdx_math':   { 'enable_dollar_delimiter': True, },
+  'mdext:PreviewExtension': { 'words': 50, },
 }
+RENDER_CACHE = None # optionally a rendercache.RenderCache shared across restarts
+
+def library_versions():
+    try:
+        from importlib.metadata import version
+        mdx_math_version = version('python-markdown-math')
+    except Exception:
+        mdx_math_version = None
+    # the tree processors of mdext.py change the HTML as much as the libraries do
+    with open(mdext.__file__, 'rb') as f:
+        mdext_digest = hashlib.sha1(f.read()).hexdigest()
+    return {
+      'markdown': markdown.__version__,
+      'pygments': pygments.__version__,
+      'mdx_math': mdx_math_version,
+      'mdext': mdext_digest,
+    }
+LIBRARY_VERSIONS = library_versions()
+
+def render_key(content_digest):
+    """ Return the render cache key for Markdown content (given by its digest) with the current rendering settings """
+    return content_key(content_digest, MD_EXTENSIONS, MD_EXT_CONFIGS, LIBRARY_VERSIONS)
+
+_markdown = threading.local()
+
+def render_markdown(text):
+    """ Return the HTML of the Markdown text and of its preview, both from a single Markdown run """
+    md = getattr(_markdown, 'instance', None)
+    if md is None:
+        md = _markdown.instance = markdown.Markdown(extensions=MD_EXTENSIONS, extension_configs=MD_EXT_CONFIGS)
+    md.reset()
+    with stage('markdown'):
+        rendered_content = md.convert(text)
+    if md.preview_root is None:
+        return rendered_content, ELLIPSIS
+    with stage('postprocess'):
+        return rendered_content, serialize(md, md.preview_root)
+
+def render_preview(text):
+    """ Return the HTML of the preview of the Markdown text, rendering only the part of it shown in the preview """
+    return render_markdown(leading_markdown(text, MD_EXT_CONFIGS['mdext:PreviewExtension']['words']))[1]
+
+
+# The fields of a post (from its header and file name), available as post.field and post['field']
+METADATA_FIELDS = ('title', 'categories', 'tags', 'creation_date', 'year', 'month', 'modification_date', 'status', 'address', 'slug')
+FIELDS = METADATA_FIELDS + ('file',)
+# The values of a post kept in the manifest of the posts folder
+RECORD_FIELDS = METADATA_FIELDS + ('offset', 'size', 'mtime', 'digest', 'content_digest')
+MANIFEST_VERSION = 2 # increase when RECORD_FIELDS or the parsing of posts change
+CONTENT_SEPARATOR = "\n\n### Content\n\n"
+ENCODING = 'utf-8'
+
+def digest(text):
+    return hashlib.sha1(text.encode(ENCODING)).hexdigest()
+
+def _rendered_size(rendered):
+    return sum(len(html) for html in rendered if html)
+
+HTML_CACHE = LRUCache(64 * 1024 * 1024, sizeof=_rendered_size) # content digest -> rendered (content or None, preview)
+
+
+class Post(object):
+    """
+    A post: the fields of its header, where to find its content and digests of both.
+
+    Only the header fields stay in memory. The content is read from the file (at the
+    offset it starts at) when it is needed, the rendered HTML is kept in HTML_CACHE.
+    If the size or modification time of the file changed since it was parsed, the file
+    is parsed again to find its content (its header fields are kept until it is reloaded).
+    The fields can also be accessed like a (read-only) mapping, for '{file}'.format(**post).
+    """
+
+    __slots__ = FIELDS + ('folder', 'offset', 'size', 'mtime', 'digest', 'content_digest', '_content')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def keys(self):
+        return FIELDS
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
 
-def add_scrollable_to_pre(html_text):
-    soup = BeautifulSoup(html_text, 'html.parser')
-    pres = soup.select('.codehilite pre')
-    for pre in pres:
-        pre['class'] = 'pre-x-scrollable'
-    return str(soup)
+    def __contains__(self, key):
+        return key in FIELDS or key == 'content'
 
-def add_bootstrap_table_style(html_text):
-    soup = BeautifulSoup(html_text, 'html.parser')
-    tables = soup.select('table')
-    for table in tables:
-        table['class'] = 'table table-striped'
-    return str(soup)
+    def __getitem__(self, key):
+        if key in FIELDS or key == 'content':
+            return getattr(self, key)
+        raise KeyError(key)
 
-def truncate_html(html, words):
-    return str(BeautifulSoup(' '.join(html.split(' ')[:words]) + '...', "html.parser"))
+    def get(self, key, default=None):
+        return self[key] if key in self else default
 
+    def __repr__(self):
+        return '<Post {}>'.format(self.file or self.title)
 
-class Post(dict):
+    @property
+    def content(self):
+        if self._content is not None:
+            return self._content
+        return self.read_content()
+
+    def read_content(self):
+        """ Read the Markdown content of the post from its file """
+        try:
+            with open(os.path.join(self.folder, self.file), 'rb') as f:
+                if self._changed(os.fstat(f.fileno())):
+                    return self._reparse(f)
+                if self.offset is not None:
+                    f.seek(self.offset)
+                data = f.read()
+        except (OSError, ValueError) as e:
+            logger.warning('Could not read the post %s: %s', self.file, e)
+            return ''
+        text = data.decode(ENCODING)
+        if self.offset is None:
+            # a file with other line endings than \n, see read_post()
+            text = _universal_newlines(text).partition(CONTENT_SEPARATOR)[2]
+        return text
+
+    def _changed(self, stat):
+        return stat.st_size != self.size or stat.st_mtime_ns != self.mtime
+
+    def modified(self):
+        """ Return whether the file of the post changed (or is gone) since the post was parsed """
+        try:
+            return self._changed(os.stat(os.path.join(self.folder, self.file)))
+        except OSError:
+            return True
+
+    def _reparse(self, f):
+        """ Parse the changed file (open as f) again, take over where its content is now and return the content """
+        post = parse_file(f)
+        logger.info('The post %s changed since it was loaded', self.file)
+        for name in ('offset', 'size', 'mtime', 'digest', 'content_digest'):
+            setattr(self, name, getattr(post, name))
+        return post._content
+
+    def record(self):
+        """ Return the values of the post needed to restore it with from_record() (without reading its file) """
+        record = dict((name, getattr(self, name)) for name in RECORD_FIELDS)
+        record['creation_date'] = self.creation_date.strftime(TIME_FMT)
+        record['modification_date'] = self.modification_date.strftime(TIME_FMT)
+        return record
+
+    @classmethod
+    def from_record(cls, folder, filename, record):
+        fields = dict((name, record[name]) for name in RECORD_FIELDS)
+        fields['creation_date'] = parse_time(fields['creation_date'])
+        fields['modification_date'] = parse_time(fields['modification_date'])
+        return cls(folder=folder, file=filename, **fields)
+
+    def unload(self):
+        """ Drop the content kept since the post was parsed (it is read from the file when needed again) """
+        if self.folder is not None:
+            self._content = None
+
+    def _cached(self):
+        """ Return the rendered (content, preview) from HTML_CACHE or the render cache; content may be None """
+        rendered = HTML_CACHE.get(self.content_digest)
+        if rendered is None and self.render_from_cache():
+            rendered = HTML_CACHE.get(self.content_digest)
+        return rendered
 
     @property
     def rendered_content(self):
-        self.render()
-        return self['_rendered_content']
+        return self.render()[0]
 
     @property
     def rendered_preview(self):
-        self.render()
-        return self['_rendered_preview']
+        # a preview is shown in lists of posts, which need not render the full posts
+        rendered = self._cached()
+        if rendered is None:
+            RENDERS.inc(('preview',))
+            rendered = (None, render_preview(self.content))
+            # reading the content keeps content_digest up to date with the file
+            HTML_CACHE.put(self.content_digest, rendered)
+        return rendered[1]
+
+    @property
+    def rendered(self):
+        rendered = HTML_CACHE.get(self.content_digest)
+        return rendered is not None and rendered[0] is not None
 
     def render(self):
-        if '_rendered_content' not in self or '_rendered_preview' not in self:
-            rendered_content = markdown(self['content'], extensions=MD_EXTENSIONS, extension_configs=MD_EXT_CONFIGS)
-            rendered_content = add_scrollable_to_pre(rendered_content)
-            rendered_content = add_bootstrap_table_style(rendered_content)
-            self['_rendered_content'] = rendered_content
-            self['_rendered_preview'] = truncate_html(rendered_content, 50)
+        """ Return the rendered (content, preview), rendering the post unless it is cached """
+        rendered = self._cached()
+        if rendered is None or rendered[0] is None:
+            RENDERS.inc(('full',))
+            # reading the content keeps content_digest up to date with the file
+            rendered = render_markdown(self.content)
+            self.set_rendered(*rendered)
+        return rendered
+
+    def render_from_cache(self):
+        if not RENDER_CACHE:
+            return False
+        cached = RENDER_CACHE.get(render_key(self.content_digest))
+        if not cached:
+            return False
+        HTML_CACHE.put(self.content_digest, tuple(cached))
+        return True
+
+    def set_rendered(self, rendered_content, rendered_preview, content_digest=None):
+        content_digest = content_digest or self.content_digest
+        HTML_CACHE.put(content_digest, (rendered_content, rendered_preview))
+        if RENDER_CACHE:
+            RENDER_CACHE.put(render_key(content_digest), [rendered_content, rendered_preview])
+
+def _universal_newlines(text):
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+def read_post(folder, filename):
+    """ Read and parse a post file. The content is kept in the post until it is unloaded. """
+    with open(os.path.join(folder, filename), 'rb') as f:
+        post = parse_file(f)
+    post.file = filename
+    post.folder = folder
+    return post
+
+def parse_file(f):
+    """ Parse the post in the open (binary) file f, noting its size, modification time and where its content starts """
+    stat = os.fstat(f.fileno())
+    f.seek(0)
+    data = f.read()
+    text = data.decode(ENCODING)
+    crlf = '\r' in text
+    post = parse_post(_universal_newlines(text) if crlf else text)
+    post.size = len(data)
+    post.mtime = stat.st_mtime_ns
+    post.digest = hashlib.sha1(data).hexdigest()
+    # the content is read by its offset in the file, unless line endings have to be translated
+    post.offset = None if crlf else len(data) - len(post._content.encode(ENCODING))
+    return post
+
+def load_post(folder, filename):
+    """ Read and parse a post file in a worker process. Returns (filename, post or None, error message). """
+    try:
+        return filename, read_post(folder, filename), None
+    except Exception as e:
+        return filename, None, str(e)
+
+def render_post(post):
+    """ Render a post in a worker process. Returns (filename, rendered content and preview, digest of the content, error message) """
+    try:
+        content = post.content
+        return post.file, render_markdown(content), digest(content), None
+    except Exception as e:
+        return post.file, None, None, str(e)
+
+def newest_first(post):
+    """ Sort key ordering posts by their creation date, newest first, and posts of the same date by their file """
+    return datetime.min - post['creation_date'], post['file']
+
+def _chunksize(jobs, workers):
+    return max(1, jobs // (workers * 4))
 
 class Posts(object):
 
 
-    def __init__(self, folder):
+    def __init__(self, folder, workers=None, manifest=True):
+        """
+        Load the posts in folder. Unless manifest is False, the parsed posts are recorded in a
+        manifest file in the folder, so that only new and changed files are read at the next start.
+        """
         self.folder = folder
         self.posts = []
         self.years = []
         self.months = []
-        for file in os.listdir(folder):
-            if file.endswith("." + FILE_EXTENSION):
+        self.files = {}
+        self.status_list = None
+        self.generation = 0
+        self.last_modified = None
+        self._search_index = None # built on first use, see search_index
+        self._search_index_lock = threading.Lock()
+        self.related = {} # file -> tuple of (file, similarity) of the most similar posts, see update_related()
+        self.related_changes = set() # files changed or removed since the related posts were found
+        self.related_version = 0
+        # lookup indexes: key -> list of posts, newest first
+        self.by_link = {}        # (year, month, slug)
+        self.by_id = {}          # file name without extension
+        self.by_status_file = {} # (status, file)
+        self.by_tag = {}
+        self.by_category = {}
+        self.by_year = {}
+        self.by_month = {}       # (year, month)
+        # number of occurrences of each tag and category in all posts
+        self.tag_counts = Counter()
+        self.category_counts = Counter()
+        files = [file for file in os.listdir(folder) if file.endswith("." + FILE_EXTENSION)]
+        manifest = Manifest(folder, MANIFEST_VERSION) if manifest else None
+        stats = {}
+        for file in files:
+            try:
+                stats[file] = os.stat(os.path.join(folder, file))
+            except OSError as e:
+                logger.warn('Could not add the post %s for the following reason:', file)
+                logger.warn(str(e))
+                continue
+            record = manifest.get(file, stats[file]) if manifest else None
+            if record is not None:
                 try:
-                    self._add_post(file)
+                    self._insert_post(Post.from_record(folder, file, record))
+                    del stats[file]
+                except (KeyError, TypeError, ValueError):
+                    pass
+        # stats of the files still to be read
+        if workers and workers > 1:
+            added = self._add_posts_parallel(list(stats), workers)
+        else:
+            added = []
+            for file in stats:
+                try:
+                    added.append(self._add_post(file))
                 except Exception as e:
                     logger.warn('Could not add the post %s for the following reason:', file)
                     logger.warn(str(e))
+        if manifest:
+            for post in added:
+                manifest.put(post['file'], stats[post['file']], post.record())
+            manifest.retain(self.files)
+            manifest.save()
         self.update_collections()
 
     def update_collections(self):
-        self.posts.sort(key=lambda post: post['creation_date'], reverse=True)
-        del self.years[:]
-        del self.months[:]
+        self.posts.sort(key=newest_first)
+        for index in self._indexes():
+            index.clear()
+        self.tag_counts.clear()
+        self.category_counts.clear()
         for post in self.posts:
-            year = date(post['creation_date'].year, 1, 1)
-            month = date(post['creation_date'].year, post['creation_date'].month, 1)
-            if year not in self.years:
-                self.years.append(year)
-            if month not in self.months:
-                self.months.append(month)
-        self.years.sort(reverse=True)
-        self.months.sort(reverse=True)
+            for index, key in self._lookup_keys(post):
+                index.setdefault(key, []).append(post)
+            self._count_properties(post, 1)
+        self._update_dates()
+
+    def _count_properties(self, post, n):
+        for counter, values in ((self.tag_counts, post['tags']), (self.category_counts, post['categories'])):
+            for value in values:
+                counter[value] += n
+                if counter[value] <= 0: del counter[value]
+
+    def _indexes(self):
+        return (self.by_link, self.by_id, self.by_status_file, self.by_tag, self.by_category, self.by_year, self.by_month)
+
+    def _lookup_keys(self, post):
+        yield self.by_link, (post['year'], post['month'], post['slug'])
+        yield self.by_id, os.path.splitext(os.path.basename(post['file']))[0]
+        yield self.by_status_file, (post['status'], post['file'])
+        for tag in set(post['tags']):
+            yield self.by_tag, tag
+        for category in set(post['categories']):
+            yield self.by_category, category
+        yield self.by_year, post['year']
+        yield self.by_month, (post['year'], post['month'])
+
+    def _add_to_indexes(self, post):
+        # the lists may be shared with another snapshot: replace them instead of modifying them in place
+        for index, key in self._lookup_keys(post):
+            posts = list(index.get(key, ()))
+            bisect.insort(posts, post, key=newest_first)
+            index[key] = posts
+        self._count_properties(post, 1)
+
+    def _remove_from_indexes(self, post):
+        for index, key in self._lookup_keys(post):
+            posts = [p for p in index[key] if p is not post]
+            if posts: index[key] = posts
+            else: del index[key]
+        self._count_properties(post, -1)
+
+    def _update_dates(self):
+        self.years[:] = [date(year, 1, 1) for year in sorted(self.by_year, reverse=True)]
+        self.months[:] = [date(year, month, 1) for year, month in sorted(self.by_month, reverse=True)]
+        self.last_modified = max((post['modification_date'] for post in self.posts), default=None)
 
     def _add_post(self, filename):
-        filecontent = open(os.path.join(self.folder, filename), 'r').read()
-        post = parse_post(filecontent)
-        post['file'] = filename
+        post = read_post(self.folder, filename)
+        self._insert_post(post)
+        return post
+
+    def _add_posts_parallel(self, filenames, workers):
+        added = []
+        if not filenames:
+            return added
+        with ProcessPoolExecutor(workers) as executor:
+            loaded = executor.map(load_post, itertools.repeat(self.folder), filenames,
+                                  chunksize=_chunksize(len(filenames), workers))
+            for filename, post, error in loaded:
+                if error is not None:
+                    logger.warn('Could not add the post %s for the following reason:', filename)
+                    logger.warn(error)
+                    continue
+                self._insert_post(post)
+                added.append(post)
+        return added
+
+    def _insert_post(self, post):
+        """ Add a post without sorting the posts or updating the lookup indexes """
         self.posts.append(post)
+        self.files[post['file']] = post
+        if self._search_index is not None:
+            self._index_post(post)
+        post.unload()
+
+    def _remove_post(self, post):
+        self.posts.remove(post)
+        del self.files[post['file']]
+        if self._search_index is not None:
+            self._search_index.remove(post['file'])
+        self._remove_from_indexes(post)
+
+    def updated(self, changed_files, removed_files):
+        """
+        Return a new snapshot of the posts with the changed files (re-)read and the removed files dropped.
+        This object is left untouched, so it can still be used while the new snapshot is built.
+        Posts of unchanged files are shared with the new snapshot.
+        """
+        new = copy.copy(self)
+        new.posts = list(self.posts)
+        new.years = list(self.years)
+        new.months = list(self.months)
+        new.files = dict(self.files)
+        search_index = self._search_index
+        new._search_index = search_index.copy() if search_index is not None else None
+        new._search_index_lock = threading.Lock()
+        for name in ('by_link', 'by_id', 'by_status_file', 'by_tag', 'by_category', 'by_year', 'by_month'):
+            setattr(new, name, dict(getattr(self, name)))
+        new.tag_counts = Counter(self.tag_counts)
+        new.category_counts = Counter(self.category_counts)
+        new.generation = self.generation + 1
+        new.related_changes = set(self.related_changes)
+        for filename in removed_files:
+            if filename in new.files:
+                new._remove_post(new.files[filename])
+                new.related_changes.add(filename)
+        for filename in changed_files:
+            old = new.files.get(filename)
+            try:
+                post = read_post(self.folder, filename)
+            except Exception as e:
+                logger.warn('Could not add the post %s for the following reason:', filename)
+                logger.warn(str(e))
+                continue
+            if old is not None:
+                if old.digest == post.digest:
+                    continue
+                # the rendered HTML is cached by the digest of the content, so it is kept if just the header changed
+                new._remove_post(old)
+            new.related_changes.add(filename)
+            if new.status_list is None or post['status'] in new.status_list:
+                new._insert_post(post)
+                new._add_to_indexes(post)
+        new.posts.sort(key=newest_first)
+        new._update_dates()
+        return new
+
+    def prerender(self, workers=None):
+        """
+        Render all posts not rendered yet (or found in the render cache), with a pool of worker processes if workers > 1.
+        The oldest posts are rendered first, so the newest ones stay in HTML_CACHE if it cannot hold all of them.
+        """
+        pending = [post for post in reversed(self.posts) if not post.rendered and not post.render_from_cache()]
+        if workers and workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(workers) as executor:
+                rendered = executor.map(render_post, pending, chunksize=_chunksize(len(pending), workers))
+                for post, (filename, result, content_digest, error) in zip(pending, rendered):
+                    if error is not None:
+                        logger.warn('Could not render the post %s for the following reason:', filename)
+                        logger.warn(error)
+                        continue
+                    post.set_rendered(*result, content_digest=content_digest)
+        else:
+            for post in pending:
+                try:
+                    post.render()
+                except Exception as e:
+                    logger.warn('Could not render the post %s for the following reason:', post['file'])
+                    logger.warn(str(e))
+
+    @property
+    def search_index(self):
+        """ The SearchIndex of the posts, built when it is first needed (reading all posts) """
+        index = self._search_index
+        if index is None:
+            with self._search_index_lock:
+                index = self._search_index
+                if index is None:
+                    start = time.time()
+                    index = SearchIndex()
+                    for post in self.posts:
+                        self._index_post(post, index)
+                    self._search_index = index
+                    logger.info('Indexed %d posts for searching in %.1f s', len(self.posts), time.time() - start)
+        return index
+
+    def update_related(self, k=RELATED_POSTS):
+        """
+        Find the k most similar posts of every post (see related.py), computing again only what
+        changed since they were last found. Until this is done, a new snapshot keeps the related
+        posts of the snapshot it was made from.
+        """
+        if not related.available(len(self.files)):
+            logger.warning('Not finding related posts: this takes too long for %d posts without NumPy and SciPy', len(self.files))
+            return
+        start = time.time()
+        changes = self.related_changes
+        # a snapshot made meanwhile may see the new related posts with the old changes, not the other way around
+        self.related = related.most_similar(self.search_index, list(self.files), k, previous=self.related, changed=changes)
+        self.related_changes = set()
+        self.related_version += 1
+        logger.info('Found the related posts of %d posts (%d changed) in %.1f s', len(self.files), len(changes), time.time() - start)
+
+    def related_posts(self, post):
+        return [self.files[file] for file, _ in self.related.get(post['file'], ()) if file in self.files]
+
+    def _index_post(self, post, index=None):
+        meta = ' '.join(post['tags'] + post['categories'])
+        (index if index is not None else self._search_index).add(post['file'], post, post['title'], meta, post['content'])
+
+    def search(self, search_phrase):
+        """ Return the posts containing all words of the search phrase, ranked by relevance (BM25), then newest first """
+        return self.search_index.search(search_phrase, tiebreak=lambda post: -post['creation_date'].timestamp())
 
     def search_literally(self, search_phrase):
-        search_phrase = search_phrase.lower()
-        literal_results = []
-        all_words_contained_results = []
-        for post in self.posts:
-            post_text = post['filecontent'].lower()
-            if search_phrase in post_text:
-                literal_results.append(post)
-            elif all(word in post_text for word in search_phrase.split()):
-                all_words_contained_results.append(post)
+        """ Return the posts containing the search phrase literally first, then those containing all of its words """
+        literal_results, all_words_contained_results = self.search_index.search_literally(search_phrase)
+        by_date = lambda post: post['creation_date']
+        literal_results.sort(key=by_date, reverse=True)
+        all_words_contained_results.sort(key=by_date, reverse=True)
         return literal_results + all_words_contained_results
 
     @property
     def latest(self):
-        newest_date = datetime(1000, 1, 1, 1, 1, 1)
-        newest_post = None
-        for post in self.posts:
-            if post['creation_date'] > newest_date:
-                newest_date = post['creation_date']
-                newest_post = post
-        return newest_post
+        return self.posts[0] if self.posts else None
+
+    def tagged(self, tag):
+        return self.by_tag.get(tag, [])
+
+    def categorized(self, category):
+        return self.by_category.get(category, [])
+
+    def from_year(self, year):
+        return self.by_year.get(year, [])
+
+    def from_month(self, year, month):
+        return self.by_month.get((year, month), [])
+
+    def _unique(self, index, key):
+        posts = index.get(key, ())
+        return posts[0] if len(posts) == 1 else None
+
+    def post_by_id(self, id):
+        """ Return the post stored in the file id.mdtxt (or None) """
+        return self._unique(self.by_id, id)
+
+    def post_by_file(self, status, file):
+        return self._unique(self.by_status_file, (status, file))
+
+    def post_by_link(self, year, month, slug):
+        return self._unique(self.by_link, (year, month, slug))
 
     def keep_only(self, status_list):
+        for post in self.posts:
+            if post['status'] not in status_list:
+                del self.files[post['file']]
+                if self._search_index is not None:
+                    self._search_index.remove(post['file'])
         self.posts = [post for post in self.posts if post['status'] in status_list]
+        self.status_list = list(status_list)
+        self.generation += 1
         self.update_collections()
 
     def keep_only_published(self):
@@ -129,52 +619,45 @@ class Posts(object):
     def total(self):
         return len(self.posts)
 
+def parse_time(text):
+    if len(text) == 19 and text[4] == '-' and text[10] == ' ':
+        # same as strptime() with TIME_FMT, but much faster
+        return datetime.fromisoformat(text)
+    return datetime.strptime(text, TIME_FMT)
+
+def parse_header(header):
+    """ Return the title and the values of the '* Name: value' lines of a post header (the first one of each name) """
+    title = None
+    values = {}
+    for line in header.split('\n'):
+        if line.startswith('* '):
+            name, separator, value = line[2:].partition(': ')
+            if separator and name not in values:
+                values[name] = value
+        elif line.startswith('# ') and title is None:
+            title = line[2:]
+    return title, values
+
 def parse_post(text):
-    post = Post()
-    header, _, postcontent = text.partition("\n\n### Content\n\n")
-    # title
-    title = re.search(r"^# (?P<result>.*)$", header, re.MULTILINE)
-    title = title.group('result')
-    # categories
-    categories = re.search(r"^\* Categories: (?P<result>.*)$", header, re.MULTILINE)
-    if categories: categories = categories.group('result').split(', ')
-    else: categories = []
-    # tags
-    tags = re.search(r"^\* Tags: (?P<result>.*)$", header, re.MULTILINE)
-    if tags: tags = tags.group('result').split(', ')
-    else: tags = []
-    # creation_date
-    creation_date = re.search(r"^\* Creation Date: (?P<result>.*)$", header, re.MULTILINE)
-    creation_date = datetime.strptime(creation_date.group('result'), TIME_FMT)
-    # modification_date
-    modification_date = re.search(r"^\* Modification Date: (?P<result>.*)$", header, re.MULTILINE)
-    if modification_date: modification_date = datetime.strptime(modification_date.group('result'), TIME_FMT)
-    else: modification_date = creation_date
-    # slug
-    slug = re.search(r"^\* Slug: (?P<result>.*)$", header, re.MULTILINE)
-    if slug: slug = slug.group('result')
-    else: slug = None
-    # status
-    status = re.search(r"^\* Status: (?P<result>.*)$", header, re.MULTILINE)
-    if status: status = status.group('result')
-    else: status = 'draft'
-    # address (from creation_date and )
+    header, _, postcontent = text.partition(CONTENT_SEPARATOR)
+    title, values = parse_header(header)
+    if title is None:
+        raise ValueError('The post has no title')
+    if 'Creation Date' not in values:
+        raise ValueError('The post has no creation date')
+    categories = values['Categories'].split(', ') if 'Categories' in values else []
+    tags = values['Tags'].split(', ') if 'Tags' in values else []
+    creation_date = parse_time(values['Creation Date'])
+    modification_date = parse_time(values['Modification Date']) if 'Modification Date' in values else creation_date
+    slug = values.get('Slug')
+    status = values.get('Status', 'draft')
+    # address (from creation_date and slug)
     if status in ('published', 'private'): address = '/{:04d}/{:02d}/{}'.format(creation_date.year, creation_date.month, slug)
     else: address = None
-    # done
-    post['title'] = title
-    post['categories'] = categories
-    post['tags'] = tags
-    post['creation_date'] = creation_date
-    post['year'] = creation_date.year
-    post['month'] = creation_date.month
-    post['modification_date'] = modification_date
-    post['status'] = status
-    post['address'] = address
-    post['slug'] = slug
-    post['content'] = postcontent
-    post['filecontent'] = text
-    return post
+    return Post(title=title, categories=categories, tags=tags, creation_date=creation_date,
+                year=creation_date.year, month=creation_date.month, modification_date=modification_date,
+                status=status, address=address, slug=slug,
+                _content=postcontent, content_digest=digest(postcontent))
 
 if __name__ == "__main__":
     import argparse, pprint, random
@@ -0,0 +1,210 @@
+"""
+A pre-forking WSGI server: the master process binds the listening socket, prepares the
+application (e.g. loads and renders the posts) and forks worker processes accepting
+connections on the shared socket. Whatever the master prepared before forking is shared
+copy-on-write between the workers.
+
+Signals to the master:
+
+* SIGHUP: call prepare() again, start new workers and gracefully stop the old ones (which
+  finish the requests they are serving). The socket stays open, no connection is refused.
+* SIGTERM, SIGINT: gracefully stop the workers and exit.
+
+Workers that exit (e.g. after max_requests requests or because they crashed) are replaced.
+"""
+
+import os, gc, time, errno, fcntl, select, signal, socket, logging, threading
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerServer(ThreadingMixIn, WSGIServer):
+    """ A threaded WSGI server accepting connections on an already listening socket """
+    daemon_threads = False
+    block_on_close = True # let server_close() wait for the requests in progress
+
+    def __init__(self, sock, app, max_requests=0):
+        WSGIServer.__init__(self, sock.getsockname()[:2], QuietRequestHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        host, port = sock.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+        self.set_app(app)
+        self.max_requests = max_requests
+        self.requests = 0
+
+    def process_request(self, request, client_address):
+        self.requests += 1
+        if self.max_requests and self.requests == self.max_requests:
+            self.stop()
+        ThreadingMixIn.process_request(self, request, client_address)
+
+    def stop(self):
+        # shutdown() blocks until serve_forever() returned, so it cannot be called from its own thread
+        threading.Thread(target=self.shutdown).start()
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """ Leave access logs to the application (see --logfile) """
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class PreforkServer(object):
+    """
+    Serve a WSGI application with a number of worker processes. prepare() is called
+    in the master before the (first and every reloaded) generation of workers is forked
+    and returns the WSGI application they serve.
+    """
+
+    def __init__(self, prepare, host='0.0.0.0', port=8080, workers=2, max_requests=0, graceful_timeout=30.):
+        self.prepare = prepare
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.app = None
+        self.socket = None
+        self.children = {} # pid -> generation
+        self.generation = 0
+        self._stopping = {} # pid -> time.time() when SIGTERM was sent
+        self._reload = False
+        self._shutdown = False
+
+    def listen(self):
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(128)
+        # all workers wait for connections on the socket, those losing the race must not block in accept()
+        self.socket.setblocking(False)
+
+    def serve_forever(self):
+        if self.socket is None:
+            self.listen()
+        self.app = self.prepare()
+        # objects created so far are never freed, keep the garbage collector from touching (and copying) their pages
+        gc.freeze()
+        logger.info('Serving on http://%s:%d/ with %d worker processes (master pid %d)', self.host, self.port, self.workers, os.getpid())
+        wakeup_read, wakeup_write = os.pipe()
+        for fd in (wakeup_read, wakeup_write):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        signal.set_wakeup_fd(wakeup_write)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGTERM, self._on_shutdown)
+        signal.signal(signal.SIGINT, self._on_shutdown)
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        try:
+            while not self._shutdown:
+                self._reap()
+                if self._reload:
+                    self._reload = False
+                    self._reload_workers()
+                self._spawn_workers()
+                self._kill_stuck_workers()
+                try:
+                    select.select([wakeup_read], [], [], 1.)
+                    os.read(wakeup_read, 1024)
+                except (OSError, select.error) as e:
+                    if getattr(e, 'errno', None) not in (errno.EAGAIN, errno.EINTR): raise
+        finally:
+            self._stop_workers(list(self.children))
+            deadline = time.time() + self.graceful_timeout
+            while self.children and time.time() < deadline:
+                self._reap()
+                time.sleep(0.1)
+            self._stop_workers(list(self.children), signal.SIGKILL)
+            signal.set_wakeup_fd(-1)
+            os.close(wakeup_read)
+            os.close(wakeup_write)
+            self.socket.close()
+
+    def reload(self):
+        """ Ask the master to prepare the application again and replace the workers (may be called from any thread) """
+        os.kill(os.getpid(), signal.SIGHUP)
+
+    def _on_reload(self, signum, frame):
+        self._reload = True
+
+    def _on_shutdown(self, signum, frame):
+        self._shutdown = True
+
+    def _reload_workers(self):
+        logger.info('Reloading')
+        start = time.time()
+        try:
+            app = self.prepare()
+        except Exception:
+            logger.exception('Reloading failed, keeping the current workers')
+            return
+        self.app = app
+        gc.freeze()
+        old = [pid for pid, generation in self.children.items() if generation == self.generation]
+        self.generation += 1
+        # the new workers accept connections before the old ones stop doing so
+        self._spawn_workers()
+        self._stop_workers(old)
+        logger.info('Reloaded in %.1f s', time.time() - start)
+
+    def _spawn_workers(self):
+        current = sum(1 for generation in self.children.values() if generation == self.generation)
+        for _ in range(self.workers - current):
+            pid = os.fork()
+            if pid == 0:
+                self._run_worker()
+            self.children[pid] = self.generation
+
+    def _run_worker(self):
+        status = 1
+        try:
+            for signum in (signal.SIGHUP, signal.SIGCHLD):
+                signal.signal(signum, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN) # the master stops us
+            signal.set_wakeup_fd(-1)
+            server = WorkerServer(self.socket, self.app, self.max_requests)
+            signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+            server.serve_forever()
+            server.server_close()
+            status = 0
+        except Exception:
+            logger.exception('Worker %d failed', os.getpid())
+        finally:
+            os._exit(status)
+
+    def _stop_workers(self, pids, signum=signal.SIGTERM):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pass
+            self._stopping.setdefault(pid, time.time())
+
+    def _kill_stuck_workers(self):
+        now = time.time()
+        for pid, since in list(self._stopping.items()):
+            if now - since > self.graceful_timeout:
+                logger.warning('Worker %d did not stop within %.0f s, killing it', pid, self.graceful_timeout)
+                self._stop_workers([pid], signal.SIGKILL)
+                self._stopping[pid] = float('inf')
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            generation = self.children.pop(pid, None)
+            stopped = self._stopping.pop(pid, None) is not None
+            if generation == self.generation and not stopped and not self._shutdown:
+                if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+                    logger.info('Worker %d exited after serving %d requests, replacing it', pid, self.max_requests)
+                else:
+                    logger.warning('Worker %d died (status %d), replacing it', pid, status)
@@ -0,0 +1,189 @@
+"""
+Related posts: the nearest neighbours of every post by the cosine similarity of
+TF-IDF vectors.
+
+The vectors are made from the search index: its term frequencies already count
+words in the title and in the tags and categories more than those in the text.
+Only the PRUNED_TERMS largest weights of every vector are kept (normalized by
+the length of the whole vector): the similarity of two posts is approximated by
+their most important terms, and common words no longer relate every post to
+every other. With NumPy and SciPy installed, the pruned vectors form a sparse
+matrix, and the similarities of all posts are computed in batches of rows by
+matrix products. Without them, every post is compared with the posts sharing
+one of its terms through inverted lists, which is too slow for more than
+MAX_DOCS_WITHOUT_NUMPY posts.
+
+When some posts changed, only their neighbours and the neighbours of the posts
+which had one of them as a neighbour are computed again. The changed posts are
+added to the neighbours of the other posts they are more similar to.
+"""
+
+import math, heapq, itertools
+from operator import itemgetter
+from collections import defaultdict
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:
+    numpy = sparse = None
+
+BATCH_SIZE = 256 # rows of the similarity matrix computed at once
+PRUNED_TERMS = 30
+MAX_CHANGED = 0.1 # fraction of the docs which may be computed again, above it all are
+MAX_DOCS_WITHOUT_NUMPY = 2000
+
+
+def available(n):
+    """ Return whether the related docs of n docs can be computed in reasonable time """
+    return numpy is not None or n <= MAX_DOCS_WITHOUT_NUMPY
+
+def tfidf_weights(index, docs):
+    """ Yield (number of the doc in docs, term, TF-IDF weight) for all terms of the docs in the SearchIndex """
+    numbers = dict((doc, number) for number, doc in enumerate(docs))
+    n = len(docs)
+    for term, posting in index.postings.items():
+        idf = math.log(n / len(posting)) if n else 0.
+        if idf <= 0.:
+            continue
+        for doc, (tf, _) in posting.items():
+            number = numbers.get(doc)
+            if number is not None:
+                yield number, term, (1. + math.log(tf)) * idf
+
+def most_similar(index, docs, k, previous=None, changed=()):
+    """
+    Return a dict doc -> tuple of (other doc, similarity) of the (up to) k most similar other docs,
+    most similar first. Given the result for an earlier version of the docs (previous) and the docs
+    changed or removed since then, only what the changes affect is computed again. The similarities
+    of the other pairs of docs are kept, although the IDF weights of their terms may have changed a bit.
+    """
+    if not docs:
+        return {}
+    n = len(docs)
+    k = min(k, n - 1)
+    scores = (_matrix_scorer if numpy is not None else _pruned_scorer)(index, docs)
+    related = {}
+    if previous:
+        numbers = dict((doc, number) for number, doc in enumerate(docs))
+        changed = set(changed)
+        stale = set(number for number, doc in enumerate(docs)
+                    if doc in changed or doc not in previous
+                    or any(other in changed or other not in numbers for other, _ in previous[doc]))
+        if len(stale) <= MAX_CHANGED * n:
+            return _updated(docs, k, scores, previous, changed, stale)
+    for number, best, _ in scores(range(n), k):
+        related[docs[number]] = tuple((docs[column], similarity) for column, similarity in best)
+    return related
+
+def _updated(docs, k, scores, previous, changed, stale):
+    related = {}
+    # a changed doc becomes a neighbour of another one if it is more similar than its last neighbour
+    above = [float('inf') if number in stale else (previous[doc][-1][1] if len(previous[doc]) >= k else 0.)
+             for number, doc in enumerate(docs)]
+    candidates = defaultdict(list)
+    changed = [number for number, doc in enumerate(docs) if doc in changed]
+    for number, best, others in scores(changed, k, above):
+        related[docs[number]] = tuple((docs[column], similarity) for column, similarity in best)
+        for column, similarity in others:
+            candidates[column].append((docs[number], similarity))
+    for number, best, _ in scores(sorted(stale.difference(changed)), k):
+        related[docs[number]] = tuple((docs[column], similarity) for column, similarity in best)
+    for number, doc in enumerate(docs):
+        if doc in related:
+            continue
+        neighbours = previous[doc]
+        if number in candidates:
+            neighbours = tuple(sorted(neighbours + tuple(candidates[number]), key=lambda item: -item[1])[:k])
+        related[doc] = neighbours
+    return related
+
+def _pruned_vectors(index, docs):
+    """ Return the pruned vectors of the docs as lists of (term, normalized weight) """
+    vectors = [[] for _ in docs]
+    for number, term, weight in tfidf_weights(index, docs):
+        vectors[number].append((term, weight))
+    pruned = []
+    for vector in vectors:
+        norm = math.sqrt(sum(weight * weight for _, weight in vector)) or 1.
+        top = heapq.nlargest(PRUNED_TERMS, vector, key=lambda item: item[1])
+        pruned.append([(term, weight / norm) for term, weight in top])
+    return pruned
+
+def _matrix_scorer(index, docs):
+    """
+    Return a function scores(numbers, k, above=None) yielding (number, best, others) for the docs
+    with the given numbers: the (up to) k most similar docs as (number, similarity), most similar
+    first, and (if above is given) all docs more similar than above[their number].
+    """
+    # the weights of tfidf_weights(), computed for all postings at once
+    doc_numbers = dict((doc, number) for number, doc in enumerate(docs))
+    n = len(docs)
+    postings = list(index.postings.values())
+    lengths = numpy.array([len(posting) for posting in postings], dtype=numpy.int64)
+    rows = numpy.fromiter(map(doc_numbers.get, itertools.chain.from_iterable(postings), itertools.repeat(-1)),
+                          dtype=numpy.int64, count=int(lengths.sum()))
+    tfs = numpy.fromiter(map(itemgetter(0), itertools.chain.from_iterable(posting.values() for posting in postings)),
+                         dtype=numpy.float64, count=len(rows))
+    columns = numpy.repeat(numpy.arange(len(postings)), lengths)
+    idfs = numpy.log(n / numpy.maximum(lengths, 1))
+    values = (1. + numpy.log(numpy.maximum(tfs, 1.))) * idfs[columns]
+    kept = (rows >= 0) & (idfs[columns] > 0.)
+    rows, columns, values = rows[kept], columns[kept], values[kept]
+    norms = numpy.sqrt(numpy.bincount(rows, weights=values * values, minlength=n))
+    norms[norms == 0.] = 1.
+    # keep the PRUNED_TERMS largest weights of every row: the rank of an entry is its
+    # position among the entries of its row sorted by decreasing weight
+    order = numpy.lexsort((-values, rows))
+    rows, columns, values = rows[order], columns[order], values[order]
+    ranks = numpy.arange(len(rows)) - numpy.searchsorted(rows, rows)
+    kept = ranks < PRUNED_TERMS
+    matrix = sparse.csr_matrix((values[kept] / norms[rows[kept]], (rows[kept], columns[kept])),
+                               shape=(n, max(1, len(postings))))
+    transposed = matrix.T.tocsc()
+
+    def scores(numbers, k, above=None):
+        numbers = numpy.asarray(numbers, dtype=numpy.int64)
+        if above is not None:
+            above = numpy.asarray(above, dtype=numpy.float64)
+        for start in range(0, len(numbers), BATCH_SIZE):
+            batch = numbers[start:start + BATCH_SIZE]
+            similarities = (matrix[batch] @ transposed).toarray()
+            similarities[numpy.arange(len(batch)), batch] = 0. # a doc is not related to itself
+            if k <= 0:
+                best = numpy.zeros((len(batch), 0), dtype=numpy.int64)
+            else:
+                best = numpy.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            best_scores = numpy.take_along_axis(similarities, best, axis=1)
+            order = numpy.argsort(-best_scores, axis=1, kind='stable')
+            best = numpy.take_along_axis(best, order, axis=1).tolist()
+            best_scores = numpy.take_along_axis(best_scores, order, axis=1).tolist()
+            for row, number in enumerate(batch.tolist()):
+                others = None
+                if above is not None:
+                    others_columns = numpy.flatnonzero(similarities[row] > above)
+                    others = list(zip(others_columns.tolist(), similarities[row, others_columns].tolist()))
+                yield number, [(column, similarity) for column, similarity in zip(best[row], best_scores[row]) if similarity > 0.], others
+    return scores
+
+def _pruned_scorer(index, docs):
+    """ Like _matrix_scorer() without NumPy: the pruned vectors are compared through inverted lists """
+    pruned = _pruned_vectors(index, docs)
+    postings = defaultdict(list) # term -> [(number of the doc, normalized weight)] of the pruned vectors
+    for number, vector in enumerate(pruned):
+        for term, weight in vector:
+            postings[term].append((number, weight))
+
+    def scores(numbers, k, above=None):
+        for number in numbers:
+            similarities = defaultdict(float)
+            for term, weight in pruned[number]:
+                for other, other_weight in postings[term]:
+                    similarities[other] += weight * other_weight
+            similarities.pop(number, None) # a doc is not related to itself
+            best = heapq.nlargest(k, similarities.items(), key=lambda item: item[1])
+            others = None
+            if above is not None:
+                others = [(other, similarity) for other, similarity in similarities.items() if similarity > above[other]]
+            yield number, [(other, similarity) for other, similarity in best if similarity > 0.], others
+    return scores
@@ -0,0 +1,155 @@
+import os, json, time, hashlib, logging, tempfile, threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE_EXTENSION = 'json'
+TMP_FILE_EXTENSION = 'tmp'
+TMP_MAX_AGE = 3600 # seconds after which a temporary file is left over from a crashed process
+
+
+def content_key(*parts):
+    """ Return a hex digest identifying the JSON serializable parts """
+    h = hashlib.sha256()
+    h.update(json.dumps(parts, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
+
+
+class RenderCache(object):
+    """
+    A content-addressed on-disk cache of rendered posts.
+
+    Entries are written to a temporary file and atomically moved into place, so
+    several processes can share one cache folder. Reading an entry bumps its
+    modification time; once the folder grows beyond max_bytes, the least recently
+    used entries are evicted by whichever process gets hold of the lock file first.
+    Temporary files left over by processes which crashed while writing are removed
+    at the start and when evicting.
+    """
+
+    def __init__(self, folder, max_bytes=256*1024*1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self._remove_leftovers()
+        self._size = sum(size for _, _, size in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], key + '.' + CACHE_FILE_EXTENSION)
+
+    def _entries(self, extension=CACHE_FILE_EXTENSION):
+        for subfolder in os.listdir(self.folder):
+            subfolder = os.path.join(self.folder, subfolder)
+            if not os.path.isdir(subfolder): continue
+            for name in os.listdir(subfolder):
+                if not name.endswith('.' + extension): continue
+                path = os.path.join(subfolder, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_mtime, st.st_size
+
+    def _remove_leftovers(self):
+        """ Delete temporary files too old to be still written by another process """
+        deadline = time.time() - TMP_MAX_AGE
+        for path, mtime, _ in list(self._entries(TMP_FILE_EXTENSION)):
+            if mtime < deadline:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            value = json.loads(data.decode('utf-8'))
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            self.bytes_read += len(data)
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        data = json.dumps(value).encode('utf-8')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.' + TMP_FILE_EXTENSION)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning('Could not write to the render cache: %s', e)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self.bytes_written += len(data)
+            self._size += len(data)
+            evict = self._size > self.max_bytes
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """ Delete the least recently used entries until the cache is below 90% of its maximum size """
+        lock_file = open(os.path.join(self.folder, '.lock'), 'w')
+        try:
+            if fcntl:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # another process is already evicting
+                    return
+            self._remove_leftovers()
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            size = sum(entry[2] for entry in entries)
+            target = self.max_bytes * 0.9
+            for path, _, entry_size in entries:
+                if size <= target: break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                size -= entry_size
+                self.evictions += 1
+            with self._lock:
+                self._size = size
+        finally:
+            lock_file.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+              'hits': self.hits,
+              'misses': self.misses,
+              'bytes_read': self.bytes_read,
+              'bytes_written': self.bytes_written,
+              'evictions': self.evictions,
+              'size': self._size,
+            }
+
+    def report(self):
+        logger.info('Render cache %s: %s', self.folder,
+          ', '.join('{}={}'.format(k, v) for k, v in sorted(self.stats().items())))
@@ -0,0 +1,142 @@
+import hashlib, math, threading, time
+from collections import OrderedDict
+
+from bottle import http_date, parse_date
+
+
+class LRUCache(object):
+    """ A thread-safe least recently used cache bounded by the total size of its values """
+
+    def __init__(self, max_bytes, sizeof=len):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= self.sizeof(self._entries.pop(key))
+            self._entries[key] = value
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= self.sizeof(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CachedResponse(object):
+    __slots__ = ('status', 'headers', 'body', 'etag', 'last_modified')
+
+    def __init__(self, status, headers, body, etag, last_modified):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class ResponseCacheMiddleware(object):
+    """
+    Cache complete responses to GET requests in memory and answer conditional requests with 304.
+
+    Entries are keyed by path and query string, the current content generation and a
+    variant of the request. variant(environ) returns a hashable value for everything
+    else a response depends on, or None if the response to this request must not be
+    cached at all. Last-Modified is the time the current generation was first seen, in whole
+    seconds and later for every new generation: the newest date of the content would answer
+    If-Modified-Since with a stale 304 after a delete or a change of related content. Responses that set their own ETag or Last-Modified (like static files) are passed through.
+    """
+
+    def __init__(self, app, generation, variant, max_bytes=64*1024*1024):
+        self.app = app
+        self.generation = generation
+        self.variant = variant
+        self.cache = LRUCache(max_bytes, sizeof=lambda response: len(response.body))
+        self._generation = None
+        self._generation_time = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] != 'GET':
+            return self.app(environ, start_response)
+        variant = self.variant(environ)
+        if variant is None:
+            return self.app(environ, start_response)
+        generation = self.generation()
+        key = (environ.get('PATH_INFO', ''), environ.get('QUERY_STRING', ''), generation, variant)
+        response = self.cache.get(key)
+        if response is None:
+            response = self._render(environ, start_response, self._last_modified(generation))
+            if not isinstance(response, CachedResponse):
+                return response
+            self.cache.put(key, response)
+        if self._not_modified(environ, response):
+            start_response('304 Not Modified', [('ETag', response.etag), ('Last-Modified', response.last_modified)])
+            return []
+        start_response(response.status, response.headers)
+        return [response.body]
+
+    def _last_modified(self, generation):
+        with self._lock:
+            if generation != self._generation:
+                self._generation = generation
+                self._generation_time = max(math.ceil(time.time()), self._generation_time + 1)
+            return self._generation_time
+
+    def _render(self, environ, start_response, last_modified):
+        """ Return the response of the app as CachedResponse or, if it cannot be cached, the app's iterable """
+        captured = []
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            return lambda data: captured.append(data)
+        result = self.app(environ, capture)
+        status, headers, exc_info = captured[:3]
+        names = set(name.lower() for name, _ in headers)
+        if not status.startswith('200') or names & {'etag', 'last-modified', 'set-cookie'}:
+            start_response(status, headers, exc_info)
+            return result
+        try:
+            body = b''.join(captured[3:]) + b''.join(result)
+        finally:
+            if hasattr(result, 'close'): result.close()
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        last_modified = http_date(last_modified)
+        headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+        headers += [('Content-Length', str(len(body))), ('ETag', etag), ('Last-Modified', last_modified), ('Vary', 'User-Agent')]
+        return CachedResponse(status, headers, body, etag, last_modified)
+
+    def _not_modified(self, environ, response):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or response.etag in tags or 'W/' + response.etag in tags
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since:
+            since = parse_date(if_modified_since.split(';')[0].strip())
+            return since is not None and since >= parse_date(response.last_modified)
+        return False
@@ -0,0 +1,153 @@
+import re, math
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Positions of different fields are kept apart by this gap so that
+# a phrase can never match across the end of one field and the start of the next.
+FIELD_GAP = 100
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex(object):
+    """
+    A positional inverted index over blog posts.
+
+    Every document is made up of three fields: the title, the meta
+    data (tags and categories) and the text itself. The postings store the
+    positions of a term in the document (for phrase queries) together with
+    a term frequency weighted by the field the term occurred in (for BM25).
+    """
+
+    FIELD_WEIGHTS = (3.0, 2.0, 1.0) # title, meta, text
+    K1 = 1.2
+    B = 0.75
+    PHRASE_BOOST = 2.0
+
+    def __init__(self):
+        self.postings = {}   # term -> {doc: (weighted_tf, positions)}
+        self.doc_terms = {}  # doc -> tuple of the distinct terms of the document
+        self.doc_lengths = {}
+        self.documents = {}  # doc -> payload returned by the queries
+        self.total_length = 0
+        self._owned = set()  # terms whose posting dict is not shared with a copy of this index
+
+    def add(self, doc, payload, title, meta, text):
+        if doc in self.documents:
+            self.remove(doc)
+        terms = {}
+        offset = 0
+        length = 0
+        for weight, field in zip(self.FIELD_WEIGHTS, (title, meta, text)):
+            tokens = tokenize(field)
+            for position, token in enumerate(tokens, offset):
+                entry = terms.setdefault(token, [0.0, []])
+                entry[0] += weight
+                entry[1].append(position)
+            offset += len(tokens) + FIELD_GAP
+            length += len(tokens)
+        for term, (tf, positions) in terms.items():
+            self._writable_posting(term)[doc] = (tf, positions)
+        self.doc_terms[doc] = tuple(terms)
+        self.doc_lengths[doc] = length
+        self.documents[doc] = payload
+        self.total_length += length
+
+    def remove(self, doc):
+        if doc not in self.documents:
+            return
+        for term in self.doc_terms.pop(doc):
+            posting = self._writable_posting(term)
+            del posting[doc]
+            if not posting:
+                del self.postings[term]
+                self._owned.discard(term)
+        self.total_length -= self.doc_lengths.pop(doc)
+        del self.documents[doc]
+
+    def _writable_posting(self, term):
+        # copy on write: posting dicts shared with a copy of the index are never mutated
+        if term not in self._owned:
+            self.postings[term] = dict(self.postings.get(term, ()))
+            self._owned.add(term)
+        return self.postings[term]
+
+    def copy(self):
+        """ Return a new index sharing the posting dicts with this one until either is modified """
+        new = SearchIndex()
+        new.postings = dict(self.postings)
+        new.doc_terms = dict(self.doc_terms)
+        new.doc_lengths = dict(self.doc_lengths)
+        new.documents = dict(self.documents)
+        new.total_length = self.total_length
+        self._owned = set()
+        return new
+
+    def __len__(self):
+        return len(self.documents)
+
+    def all_words(self, terms):
+        """ Return the set of documents containing all of the terms """
+        if not terms:
+            return set()
+        postings = sorted((self.postings.get(term, {}) for term in set(terms)), key=len)
+        docs = set(postings[0])
+        for posting in postings[1:]:
+            docs.intersection_update(posting)
+            if not docs: break
+        return docs
+
+    def phrase(self, terms, docs=None):
+        """ Return the set of documents containing the terms as a consecutive phrase """
+        if docs is None:
+            docs = self.all_words(terms)
+        if len(terms) < 2:
+            return set(docs)
+        result = set()
+        for doc in docs:
+            starts = set(self.postings[terms[0]][doc][1])
+            for i, term in enumerate(terms[1:], 1):
+                starts.intersection_update(p - i for p in self.postings[term][doc][1])
+                if not starts: break
+            if starts:
+                result.add(doc)
+        return result
+
+    def score(self, terms, doc):
+        """ The BM25 score of a document for the query terms, with title and meta data matches boosted """
+        n = len(self.documents)
+        avg_length = self.total_length / n if n else 0.0
+        length_norm = 1.0 - self.B + self.B * (self.doc_lengths[doc] / avg_length if avg_length else 0.0)
+        score = 0.0
+        for term in set(terms):
+            posting = self.postings.get(term)
+            if not posting or doc not in posting: continue
+            tf = posting[doc][0]
+            idf = math.log(1.0 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            score += idf * tf * (self.K1 + 1.0) / (tf + self.K1 * length_norm)
+        return score
+
+    def search(self, query, tiebreak=None):
+        """
+        Return the payloads of the documents matching all words of the query, best match first.
+        Documents with equal scores are ordered by tiebreak(payload) if given, then by doc.
+        """
+        terms = tokenize(query)
+        docs = self.all_words(terms)
+        phrase_docs = self.phrase(terms, docs)
+        scored = []
+        for doc in docs:
+            score = self.score(terms, doc)
+            if doc in phrase_docs:
+                score *= self.PHRASE_BOOST
+            scored.append((-score, tiebreak(self.documents[doc]) if tiebreak else 0, doc))
+        scored.sort()
+        return [self.documents[doc] for _, _, doc in scored]
+
+    def search_literally(self, query):
+        """ Return the payloads of documents containing the query as a phrase and of those containing all of its words """
+        terms = tokenize(query)
+        docs = self.all_words(terms)
+        phrase_docs = self.phrase(terms, docs)
+        return [self.documents[doc] for doc in phrase_docs], [self.documents[doc] for doc in docs - phrase_docs]
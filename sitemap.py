@@ -0,0 +1,112 @@
+"""
+Sitemaps (https://www.sitemaps.org/protocol.html) of the blog, kept gzip-compressed in memory.
+
+A sitemap may list at most 50,000 URLs and be at most 50 MB (uncompressed). Larger sites
+get a sitemap index at /sitemap.xml listing the sitemaps /sitemap-1.xml, /sitemap-2.xml, ...
+"""
+
+import zlib, hashlib
+from xml.sax.saxutils import escape
+
+MAX_URLS = 50000
+MAX_BYTES = 50 * 1024 * 1024
+INDEX_PATH = '/sitemap.xml'
+CHILD_PATH = '/sitemap-{}.xml'
+
+XML_DECLARATION = b"<?xml version='1.0' encoding='UTF-8'?>\n"
+URLSET_START = XML_DECLARATION + b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URLSET_END = b'</urlset>\n'
+INDEX_START = XML_DECLARATION + b'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+INDEX_END = b'</sitemapindex>\n'
+
+
+def _lastmod(date):
+    return '<lastmod>{}</lastmod>'.format(date.date().isoformat()) if date else ''
+
+def url_entry(loc, lastmod=None, priority=None):
+    entry = '<url><loc>{}</loc>{}{}</url>\n'.format(escape(loc), _lastmod(lastmod),
+                                                   '<priority>{}</priority>'.format(priority) if priority else '')
+    return entry.encode('utf-8')
+
+def sitemap_entry(loc, lastmod=None):
+    return '<sitemap><loc>{}</loc>{}</sitemap>\n'.format(escape(loc), _lastmod(lastmod)).encode('utf-8')
+
+
+class _GzipDocument(object):
+    """ An XML document compressed while it is written """
+
+    def __init__(self, start):
+        self._compressor = zlib.compressobj(9, zlib.DEFLATED, 31) # 31: gzip container
+        self._parts = []
+        self.size = 0
+        self.entries = 0
+        self.lastmod = None
+        self.write(start)
+
+    def write(self, data):
+        self.size += len(data)
+        self._parts.append(self._compressor.compress(data))
+
+    def add(self, entry, lastmod):
+        self.write(entry)
+        self.entries += 1
+        if lastmod and (self.lastmod is None or lastmod > self.lastmod):
+            self.lastmod = lastmod
+
+    def finish(self, end):
+        self.write(end)
+        self._parts.append(self._compressor.flush())
+        return b''.join(self._parts)
+
+
+class Sitemap(object):
+    """
+    The sitemap(s) of the URLs given as (path, last modification datetime or None, priority or None),
+    relative to baselink. Documents are looked up by their path (like /sitemap.xml).
+    """
+
+    def __init__(self, baselink, urls, max_urls=MAX_URLS, max_bytes=MAX_BYTES):
+        self.baselink = baselink
+        self.documents = {} # path -> (gzip-compressed XML, ETag)
+        chunks = []
+        document = _GzipDocument(URLSET_START)
+        for path, lastmod, priority in urls:
+            entry = url_entry(baselink + path, lastmod, priority)
+            if document.entries and (document.entries >= max_urls or document.size + len(entry) + len(URLSET_END) > max_bytes):
+                chunks.append((document.finish(URLSET_END), document.lastmod))
+                document = _GzipDocument(URLSET_START)
+            document.add(entry, lastmod)
+        chunks.append((document.finish(URLSET_END), document.lastmod))
+
+        if len(chunks) == 1:
+            self._add(INDEX_PATH, chunks[0][0])
+            return
+        index = _GzipDocument(INDEX_START)
+        for number, (data, lastmod) in enumerate(chunks, 1):
+            path = CHILD_PATH.format(number)
+            self._add(path, data)
+            index.add(sitemap_entry(baselink + path, lastmod), lastmod)
+        self._add(INDEX_PATH, index.finish(INDEX_END))
+
+    def _add(self, path, data):
+        self.documents[path] = (data, '"{}"'.format(hashlib.sha1(data).hexdigest()))
+
+    @property
+    def paths(self):
+        return sorted(self.documents)
+
+    def document(self, path):
+        """ Return the gzip-compressed document and its ETag, or (None, None) """
+        return self.documents.get(path, (None, None))
+
+
+def gunzip_stream(data, chunk_size=64 * 1024):
+    """ Yield the decompressed content of gzip data piece by piece """
+    decompressor = zlib.decompressobj(31)
+    for start in range(0, len(data), chunk_size):
+        output = decompressor.decompress(data[start:start + chunk_size])
+        if output:
+            yield output
+    output = decompressor.flush()
+    if output:
+        yield output
@@ -9,6 +9,37 @@ $(document).ready(function() {
 });
 
 
+/* suggest posts, tags and categories while typing into the search field,
+   asking the server only once typing paused for SUGGEST_DELAY ms */
+var SUGGEST_DELAY = 200;
+$(document).ready(function() {
+    var field = $('#search-field');
+    if (!field.length) return;
+    var list = $('<div id="search-suggestions" class="list-group"></div>').insertAfter(field.closest('.input-group'));
+    var timer = null, sent = 0;
+    field.attr('autocomplete', 'off');
+    field.on('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(function() {
+            var query = $.trim(field.val()), number = ++sent;
+            if (!query) {
+                list.empty();
+                return;
+            }
+            $.getJSON('/search/suggest', {q: query}, function(data) {
+                // ignore the answer if a newer query was sent in the meantime
+                if (number !== sent) return;
+                list.empty();
+                $.each(data.suggestions, function(i, suggestion) {
+                    $('<a class="list-group-item list-group-item-action"></a>').attr('href', suggestion.url).text(suggestion.text + ' ')
+                      .append($('<small class="text-muted"></small>').text(suggestion.kind)).appendTo(list);
+                });
+            });
+        }, SUGGEST_DELAY);
+    });
+});
+
+
 /* enable line numbers for pre tags
    http://www.jquery2dotnet.com/2013/09/pre-tag-with-line-numbers-using-css3.html */
 $(document).ready(function() {
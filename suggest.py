@@ -0,0 +1,82 @@
+"""
+Completions of what is typed into the search field: post titles, tags and categories.
+
+Every title is found by the start of each of its words, tags and categories by their
+start. The keys are kept in a sorted array searched with bisect. For a prefix of
+SHORT_PREFIX characters or less, so many keys match that the best completions are
+computed in advance. For longer prefixes, at most MAX_SCAN matching keys are looked
+at, so no query takes much longer than any other.
+"""
+
+import re
+from bisect import bisect_left
+
+SHORT_PREFIX = 3
+MAX_SCAN = 1000
+MAX_RESULTS = 10
+WORD_START_RE = re.compile(r"\b\w")
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+class Suggestions(object):
+    """
+    The completions of the given items (text, kind, url, weight): the higher the weight,
+    the earlier an item is suggested. Matches at the start of the text get its full weight,
+    matches at the start of a later word half of it.
+    """
+
+    def __init__(self, items, max_results=MAX_RESULTS):
+        self.max_results = max_results
+        self.items = [] # (text, kind, url)
+        entries = []    # (key, -weight, number of the item)
+        for number, (text, kind, url, weight) in enumerate(items):
+            self.items.append((text, kind, url))
+            key = normalize(text)
+            starts = [match.start() for match in WORD_START_RE.finditer(key)] or [0]
+            if starts[0] != 0:
+                starts.insert(0, 0)
+            for start in starts:
+                entries.append((key[start:], -(weight if start == 0 else weight / 2.), number))
+        entries.sort()
+        self.keys = [key for key, _, _ in entries]
+        self.entries = [(weight, number) for _, weight, number in entries]
+        self.short = {} # prefix -> [(weight, number), ...], best first
+        for key, entry in zip(self.keys, self.entries):
+            for length in range(1, min(SHORT_PREFIX, len(key)) + 1):
+                self.short.setdefault(key[:length], []).append(entry)
+        for prefix, candidates in self.short.items():
+            self.short[prefix] = self._best(candidates)
+
+    def _best(self, candidates):
+        """ Return the best candidates (weight, number of the item), one per item """
+        best = []
+        seen = set()
+        for weight, number in sorted(candidates):
+            if number in seen: continue
+            seen.add(number)
+            best.append((weight, number))
+            if len(best) == self.max_results: break
+        return best
+
+    def complete(self, prefix, limit=None):
+        """ Return up to limit items (text, kind, url) completing the prefix, best first """
+        prefix = normalize(prefix)
+        limit = max(1, min(limit or self.max_results, self.max_results))
+        if not prefix:
+            return []
+        if len(prefix) <= SHORT_PREFIX:
+            best = self.short.get(prefix, [])
+        else:
+            candidates = []
+            i = bisect_left(self.keys, prefix)
+            for key, entry in zip(self.keys[i:i + MAX_SCAN], self.entries[i:i + MAX_SCAN]):
+                if not key.startswith(prefix): break
+                candidates.append(entry)
+            best = self._best(candidates)
+        return [self.items[number] for _, number in best[:limit]]
+
+    def __len__(self):
+        return len(self.items)
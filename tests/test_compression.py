@@ -0,0 +1,83 @@
+"""
+Content-Encoding negotiation: the encoding chosen for an Accept-Encoding header and
+the ETags of compressed responses, which carry the encoding and are revalidated.
+
+    python -m pytest tests/
+"""
+
+import os, sys, gzip
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import compression
+from compression import CompressionMiddleware, negotiate
+
+BODY = b'<p>' + b'compressible text ' * 200 + b'</p>'
+ETAG = '"abc"'
+
+
+def page(environ, start_response):
+    """ A page with an ETag, answering If-None-Match like the response cache """
+    if environ.get('HTTP_IF_NONE_MATCH') == ETAG:
+        start_response('304 Not Modified', [('ETag', ETAG)])
+        return []
+    content_type = environ.get('HTTP_X_CONTENT_TYPE', 'text/html; charset=UTF-8')
+    start_response('200 OK', [('Content-Type', content_type), ('Content-Length', str(len(BODY))), ('ETag', ETAG)])
+    return [BODY]
+
+def get(app, **headers):
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/'}
+    environ.update(('HTTP_' + name.upper(), value) for name, value in headers.items())
+    captured = []
+    body = b''.join(app(environ, lambda status, headers, exc_info=None: captured.extend([status, dict(headers)])))
+    return captured[0], captured[1], body
+
+
+def test_negotiate():
+    assert negotiate('gzip, deflate', ('br', 'gzip')) == 'gzip'
+    assert negotiate('br;q=0.5, gzip;q=0.8', ('br', 'gzip')) == 'gzip'
+    assert negotiate('br, gzip', ('br', 'gzip')) == 'br'
+    assert negotiate('*', ('br', 'gzip')) == 'br'
+    assert negotiate('*, br;q=0', ('br', 'gzip')) == 'gzip'
+    assert negotiate('GZIP;q=0.1', ('gzip',)) == 'gzip'
+    assert negotiate('gzip;q=0', ('gzip',)) is None
+    assert negotiate('identity', ('gzip',)) is None
+    assert negotiate(None, ('gzip',)) is None
+    assert negotiate('gzip;q=oops', ('gzip',)) is None
+
+def test_compressed_etag_carries_the_encoding():
+    app = CompressionMiddleware(page, min_size=100)
+    status, headers, body = get(app, accept_encoding='gzip')
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['ETag'] == '"abc-gzip"'
+    assert headers['Content-Length'] == str(len(body))
+    assert 'Accept-Encoding' in headers['Vary']
+    assert gzip.decompress(body) == BODY
+    status, headers, body = get(app)
+    assert headers['ETag'] == ETAG and body == BODY and 'Content-Encoding' not in headers
+    assert 'Accept-Encoding' in headers['Vary']
+
+def test_revalidating_compressed_responses():
+    app = CompressionMiddleware(page, min_size=100)
+    status, headers, _ = get(app, accept_encoding='gzip', if_none_match='"abc-gzip"')
+    assert status.startswith('304') and headers['ETag'] == '"abc-gzip"'
+    # a client holding the uncompressed representation keeps it
+    status, headers, _ = get(app, accept_encoding='gzip', if_none_match=ETAG)
+    assert status.startswith('304') and headers['ETag'] == ETAG
+    status, _, _ = get(app, if_none_match='"abc-gzip"')
+    assert status.startswith('200')
+    if compression.brotli:
+        status, _, body = get(app, accept_encoding='br', if_none_match='"abc-gzip"')
+        assert status.startswith('200') and compression.brotli.decompress(body) == BODY
+
+def test_compressed_once_per_etag():
+    app = CompressionMiddleware(page, min_size=100)
+    get(app, accept_encoding='gzip')
+    get(app, accept_encoding='gzip')
+    assert (app.cache.hits, app.cache.misses) == (1, 1)
+
+def test_small_and_binary_responses_are_not_compressed():
+    status, headers, body = get(CompressionMiddleware(page, min_size=len(BODY) + 1), accept_encoding='gzip')
+    assert body == BODY and headers['ETag'] == ETAG and 'Content-Encoding' not in headers
+    status, headers, body = get(CompressionMiddleware(page, min_size=100), accept_encoding='gzip', x_content_type='image/png')
+    assert body == BODY and headers['ETag'] == ETAG and 'Vary' not in headers
@@ -0,0 +1,81 @@
+"""
+The manifest of the posts folder: records are only used while the modification time
+and size of their file are unchanged, and not for files changed shortly before the
+manifest was written.
+
+    python -m pytest tests/
+"""
+
+import os, sys, json, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import manifest, posts
+from manifest import Manifest
+from test_posts import write_post
+
+PAST = time.time() - 3600
+
+
+def write(folder, name, data, mtime=PAST):
+    path = os.path.join(str(folder), name)
+    with open(path, 'w') as f:
+        f.write(data)
+    os.utime(path, (mtime, mtime))
+    return os.stat(path)
+
+def saved(folder, stats, version=1):
+    saving = Manifest(str(folder), version)
+    for name, stat in stats.items():
+        saving.put(name, stat, {'name': name})
+    saving.save()
+    return Manifest(str(folder), version)
+
+
+def test_records_of_unchanged_files(tmp_path):
+    stat = write(tmp_path, 'a', 'data')
+    assert saved(tmp_path, {'a': stat}).get('a', stat) == {'name': 'a'}
+
+def test_stale_on_mtime_and_size(tmp_path):
+    stat = write(tmp_path, 'a', 'data')
+    loaded = saved(tmp_path, {'a': stat})
+    assert loaded.get('a', write(tmp_path, 'a', 'data', mtime=PAST + 1)) is None
+    assert loaded.get('a', write(tmp_path, 'a', 'more data')) is None
+    assert loaded.get('b', stat) is None
+
+def test_racy_files_are_read_again(tmp_path):
+    stat = write(tmp_path, 'a', 'data', mtime=time.time())
+    assert saved(tmp_path, {'a': stat}).get('a', stat) is None
+
+def test_other_versions_and_broken_manifests_are_ignored(tmp_path):
+    stat = write(tmp_path, 'a', 'data')
+    saved(tmp_path, {'a': stat}, version=1)
+    assert Manifest(str(tmp_path), 2).get('a', stat) is None
+    with open(os.path.join(str(tmp_path), manifest.MANIFEST_FILE), 'w') as f:
+        f.write('{broken')
+    assert Manifest(str(tmp_path), 1).get('a', stat) is None
+
+def test_retain_drops_removed_files(tmp_path):
+    stats = {'a': write(tmp_path, 'a', 'data'), 'b': write(tmp_path, 'b', 'data')}
+    loaded = saved(tmp_path, stats)
+    loaded.retain(['a'])
+    loaded.save()
+    with open(loaded.path) as f:
+        assert sorted(json.load(f)['files']) == ['a']
+
+def test_posts_are_read_again_when_their_file_changed(tmp_path):
+    first = write_post(tmp_path, 'first', 'First')
+    second = write_post(tmp_path, 'second', 'Second')
+    for name in (first, second):
+        os.utime(os.path.join(str(tmp_path), name), (PAST, PAST))
+    assert sorted(post['title'] for post in posts.Posts(str(tmp_path)).posts) == ['First', 'Second']
+    assert os.path.exists(os.path.join(str(tmp_path), manifest.MANIFEST_FILE))
+    # same size, another modification time
+    write_post(tmp_path, 'first', 'Frist')
+    os.utime(os.path.join(str(tmp_path), first), (PAST + 1, PAST + 1))
+    # same modification time, another size
+    write_post(tmp_path, 'second', 'Second edited')
+    os.utime(os.path.join(str(tmp_path), second), (PAST, PAST))
+    loaded = posts.Posts(str(tmp_path))
+    assert sorted(post['title'] for post in loaded.posts) == ['Frist', 'Second edited']
+    assert loaded.files[first].content == 'Some text.\n'
@@ -0,0 +1,117 @@
+"""
+Snapshots of the posts: Posts.updated() re-reads changed files and drops removed ones
+while the snapshot it was made from stays as it was, and the lookup indexes it keeps
+up to date are the same as those built from scratch.
+
+    python -m pytest tests/
+"""
+
+import os, sys, random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import posts
+
+POST = """# {title}
+
+* Categories: {category}
+* Tags: {tags}
+* Creation Date: {date}
+* Status: {status}
+* Slug: {slug}
+
+### Content
+
+{text}
+"""
+
+
+def write_post(folder, name, title, date='2020-01-01 12:00:00', tags='one, two', category='Notes',
+               status='published', text='Some text.'):
+    path = os.path.join(str(folder), name + '.' + posts.FILE_EXTENSION)
+    with open(path, 'w') as f:
+        f.write(POST.format(title=title, category=category, tags=tags, date=date, status=status,
+                            slug=name, text=text))
+    return os.path.basename(path)
+
+def titles(snapshot):
+    return [post['title'] for post in snapshot.posts]
+
+def indexes(snapshot):
+    """ The lookup indexes of the snapshot, with the posts replaced by their files """
+    return [dict((key, [post['file'] for post in posts]) for key, posts in index.items()) for index in snapshot._indexes()]
+
+
+def test_changed_and_removed_files(tmp_path):
+    first = write_post(tmp_path, 'first', 'First', date='2020-01-01 12:00:00')
+    second = write_post(tmp_path, 'second', 'Second', date='2020-02-01 12:00:00', tags='two')
+    old = posts.Posts(str(tmp_path), manifest=False)
+    assert sorted(titles(old)) == ['First', 'Second']
+    write_post(tmp_path, 'first', 'First edited', date='2020-01-01 12:00:00', tags='three')
+    os.remove(os.path.join(str(tmp_path), second))
+    new = old.updated([first], [second])
+    assert titles(new) == ['First edited']
+    assert new.generation == old.generation + 1
+    assert new.related_changes == {first, second}
+    assert set(new.tag_counts) == {'three'} and new.tagged('one') == []
+    assert [post['title'] for post in new.tagged('three')] == ['First edited']
+    # the old snapshot is left untouched
+    assert sorted(titles(old)) == ['First', 'Second']
+    assert old.tag_counts['two'] == 2 and old.tagged('three') == []
+    assert second in old.files
+
+def test_new_files_are_added(tmp_path):
+    write_post(tmp_path, 'first', 'First', date='2020-01-01 12:00:00')
+    old = posts.Posts(str(tmp_path), manifest=False)
+    added = write_post(tmp_path, 'added', 'Added', date='2021-01-01 12:00:00')
+    new = old.updated([added], [])
+    assert sorted(titles(new)) == ['Added', 'First']
+    assert new.latest['title'] == 'Added'
+    assert [d.year for d in new.years] != [d.year for d in old.years]
+
+def test_search_follows_the_changes(tmp_path):
+    first = write_post(tmp_path, 'first', 'First', text='about gardening')
+    old = posts.Posts(str(tmp_path), manifest=False)
+    assert [post['title'] for post in old.search('gardening')] == ['First']
+    write_post(tmp_path, 'first', 'First', text='about cooking')
+    new = old.updated([first], [])
+    assert new.search('gardening') == []
+    assert [post['title'] for post in new.search('cooking')] == ['First']
+    assert [post['title'] for post in old.search('gardening')] == ['First']
+
+def test_unreadable_and_unchanged_files(tmp_path):
+    first = write_post(tmp_path, 'first', 'First')
+    old = posts.Posts(str(tmp_path), manifest=False)
+    new = old.updated([first, 'missing.' + posts.FILE_EXTENSION], [])
+    assert titles(new) == ['First']
+    assert new.files[first] is old.files[first]
+    assert not new.related_changes
+
+def test_lookup_indexes_match_a_full_load(tmp_path):
+    rng = random.Random(0)
+    tags = ['alpha', 'beta', 'gamma', 'delta']
+    def write(number):
+        return write_post(tmp_path, 'post-{}'.format(number), 'Post {}'.format(number),
+                          date='20{:02d}-{:02d}-01 12:00:00'.format(rng.randint(10, 12), rng.randint(1, 12)),
+                          tags=', '.join(rng.sample(tags, 2)), category=rng.choice(['Notes', 'Projects']),
+                          status=rng.choice(['published', 'published', 'draft']))
+    for number in range(12):
+        write(number)
+    snapshot = posts.Posts(str(tmp_path), manifest=False)
+    for _ in range(10):
+        changed = [write(number) for number in rng.sample(range(15), 3)]
+        removed = [name for name in rng.sample(sorted(snapshot.files), 2) if name not in changed]
+        for name in removed:
+            os.remove(os.path.join(str(tmp_path), name))
+        previous = indexes(snapshot)
+        updated = snapshot.updated(changed, removed)
+        assert indexes(snapshot) == previous
+        snapshot = updated
+        assert indexes(snapshot) == indexes(posts.Posts(str(tmp_path), manifest=False))
+    loaded = posts.Posts(str(tmp_path), manifest=False)
+    snapshot.keep_only_published()
+    loaded.keep_only_published()
+    assert indexes(snapshot) == indexes(loaded)
+    assert snapshot.tag_counts == loaded.tag_counts and snapshot.category_counts == loaded.category_counts
+    for post in loaded.posts:
+        assert snapshot.post_by_link(post['year'], post['month'], post['slug'])['file'] == post['file']
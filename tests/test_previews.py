@@ -0,0 +1,47 @@
+"""
+The preview of a post must not depend on how it was rendered: from its leading blocks
+(posts.render_preview) or truncated from the full render (posts.render_markdown).
+
+    python -m pytest tests/
+"""
+
+import os, sys, random
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import posts, corpus
+
+WORDS = 50
+
+
+def full_preview(text):
+    return posts.render_markdown(text)[1]
+
+def words(prefix, n):
+    return ' '.join('{}{}'.format(prefix, i) for i in range(n))
+
+
+def test_math_block_followed_by_list():
+    text = 'One two.\n\n$$\n' + words('x', 80) + '\n$$\n\n* a b\n* c d\n\nMore text here.\n\nEnd.\n'
+    assert posts.render_preview(text) == full_preview(text)
+    assert '<li>a b</li>' in posts.render_preview(text)
+
+def test_atomic_blocks_and_markup():
+    texts = [
+      'Intro.\n\n    ' + '\n    '.join('code %d' % i for i in range(60)) + '\n\n| a | b |\n|---|---|\n| 1 | 2 |\n\nx\n\ny\n',
+      'Math $a + b + c + d + e + f$ ' * 12 + '\n\n* one\n* two\n\nafter\n\nend\n',
+      'Text.\n\n<pre>\n' + words('p', 70) + '\n</pre>\n\n1. a\n2. b\n\nc\n\nd\n',
+      'See [the link text](http://example.com "a title") ![an image](a.png) ' * 8 + '\n\n- a\n- b\n\nc\n\nd\n',
+      words('w', 45) + '\n\n- a\n\n- b\n\n- c\n\nTail.\n\nLast.\n',
+    ]
+    for text in texts:
+        assert posts.render_preview(text) == full_preview(text), text
+
+def test_generated_posts():
+    rng = random.Random(0)
+    for number in range(300):
+        text = corpus.post_text(rng, number, datetime(2020, 1, 1), [], ['Uncategorized']).partition(posts.CONTENT_SEPARATOR)[2]
+        assert posts.render_preview(text) == full_preview(text), text
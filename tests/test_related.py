@@ -0,0 +1,121 @@
+"""
+Related posts found again only for what changed must be those found for all posts, with
+and without NumPy, as long as the IDF weights are unchanged. When they changed, the
+changed posts still get exactly the neighbours found for all posts.
+
+    python -m pytest tests/
+"""
+
+import os, sys, random
+from datetime import datetime
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import related, corpus
+from searchindex import SearchIndex
+
+K = 5
+DOCS = 300
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def scorer(request, monkeypatch):
+    if request.param == 'numpy':
+        if related.numpy is None:
+            pytest.skip('NumPy and SciPy are not installed')
+    else:
+        monkeypatch.setattr(related, 'numpy', None)
+
+@pytest.fixture
+def updates(monkeypatch):
+    """ Count the results found again only for what changed """
+    calls = []
+    updated = related._updated
+    monkeypatch.setattr(related, '_updated', lambda *args: calls.append(args) or updated(*args))
+    return calls
+
+def generated(seed=0):
+    rng = random.Random(seed)
+    index = SearchIndex()
+    for number in range(DOCS):
+        text = corpus.post_text(rng, number, datetime(2020, 1, 1), [], ['Notes']).partition('### Content')[2]
+        index.add('doc-{:03d}'.format(number), None, 'Post {}'.format(number), '', text)
+    return index
+
+def rounded(result):
+    return dict((doc, [(other, round(similarity, 9)) for other, similarity in neighbours])
+                for doc, neighbours in result.items())
+
+def with_other_frequencies(index, doc, rng):
+    """ Return a copy of the index in which the doc has other term frequencies, but the same terms """
+    terms = list(index.doc_terms[doc])
+    changed = index.copy()
+    changed.add(doc, None, '', '', ' '.join(terms + [rng.choice(terms) for _ in range(len(terms))]))
+    return changed
+
+
+def test_same_as_all_with_unchanged_idf(scorer, updates):
+    rng = random.Random(1)
+    index = generated()
+    docs = sorted(index.documents)
+    previous = related.most_similar(index, docs, K)
+    for _ in range(3):
+        changed = rng.sample(docs, 2)
+        for doc in changed:
+            index = with_other_frequencies(index, doc, rng)
+        incremental = related.most_similar(index, docs, K, previous=previous, changed=changed)
+        assert rounded(incremental) == rounded(related.most_similar(index, docs, K))
+        previous = incremental
+    assert len(updates) == 3
+
+def test_changed_and_removed_docs(scorer, updates):
+    rng = random.Random(2)
+    index = generated()
+    docs = sorted(index.documents)
+    previous = related.most_similar(index, docs, K)
+    # posts which are the neighbours of few others, so that only what they affect is found again
+    neighbour_of = dict((doc, sum(other == doc for neighbours in previous.values() for other, _ in neighbours)) for doc in docs)
+    quiet = sorted(docs, key=neighbour_of.get)
+    changed, removed = quiet[:3], quiet[3:6]
+    index = index.copy()
+    for doc in changed:
+        index.add(doc, None, 'Changed', '', corpus.post_text(rng, 0, datetime(2020, 1, 1), [], ['Notes']))
+    for doc in removed:
+        index.remove(doc)
+    docs = sorted(index.documents)
+    incremental = related.most_similar(index, docs, K, previous=previous, changed=changed + removed)
+    full = related.most_similar(index, docs, K)
+    assert len(updates) == 1
+    assert sorted(incremental) == docs
+    for doc in changed:
+        assert rounded({doc: incremental[doc]}) == rounded({doc: full[doc]})
+    for neighbours in incremental.values():
+        assert len(neighbours) == K
+        assert not set(removed).intersection(other for other, _ in neighbours)
+        similarities = [similarity for _, similarity in neighbours]
+        assert similarities == sorted(similarities, reverse=True)
+
+def test_too_many_changes_find_all_again(scorer, updates):
+    index = generated()
+    docs = sorted(index.documents)
+    previous = related.most_similar(index, docs, K)
+    stale = dict((doc, ()) for doc in docs) # would be kept if only what changed was found again
+    changed = docs[:int(related.MAX_CHANGED * DOCS) + 1]
+    assert rounded(related.most_similar(index, docs, K, previous=stale, changed=changed)) == rounded(previous)
+    assert not updates
+
+def test_scorers_agree(monkeypatch):
+    if related.numpy is None:
+        pytest.skip('NumPy and SciPy are not installed')
+    index = generated()
+    docs = sorted(index.documents)
+    with_numpy = related.most_similar(index, docs, K)
+    monkeypatch.setattr(related, 'numpy', None)
+    without_numpy = related.most_similar(index, docs, K)
+    for doc in docs:
+        assert [round(similarity, 6) for _, similarity in with_numpy[doc]] == \
+               [round(similarity, 6) for _, similarity in without_numpy[doc]]
@@ -0,0 +1,60 @@
+"""
+The on-disk render cache: hits and misses, eviction of the least recently used entries
+and keys changing with everything the HTML depends on.
+
+    python -m pytest tests/
+"""
+
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import posts, rendercache
+from rendercache import RenderCache, content_key
+
+
+def test_hits_and_misses(tmp_path):
+    cache = RenderCache(str(tmp_path))
+    key = content_key('digest')
+    assert cache.get(key) is None
+    cache.put(key, ['<p>content</p>', '<p>preview</p>'])
+    assert cache.get(key) == ['<p>content</p>', '<p>preview</p>']
+    # another process sharing the folder
+    assert RenderCache(str(tmp_path)).get(key) == ['<p>content</p>', '<p>preview</p>']
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+def test_eviction_keeps_recently_used_entries(tmp_path):
+    value = ['x' * 1000, 'y']
+    cache = RenderCache(str(tmp_path), max_bytes=5000)
+    keys = [content_key(i) for i in range(4)]
+    for i, key in enumerate(keys):
+        cache.put(key, value)
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+    cache.get(keys[0]) # the oldest entry is used again
+    cache.put(content_key('new'), value)
+    assert cache.stats()['size'] <= 5000 * 0.9
+    assert cache.get(keys[0]) == value
+    assert cache.get(keys[1]) is None
+    assert cache.get(content_key('new')) == value
+
+def test_leftover_temporary_files_are_removed(tmp_path):
+    cache = RenderCache(str(tmp_path))
+    cache.put(content_key('a'), ['a', 'b'])
+    subfolder = os.path.dirname(cache._path(content_key('a')))
+    old = os.path.join(subfolder, 'crashed.tmp')
+    recent = os.path.join(subfolder, 'writing.tmp')
+    for path in (old, recent):
+        with open(path, 'w') as f:
+            f.write('partial')
+    past = time.time() - rendercache.TMP_MAX_AGE - 10
+    os.utime(old, (past, past))
+    cache.evict()
+    assert not os.path.exists(old)
+    assert os.path.exists(recent)
+
+def test_render_key_depends_on_mdext():
+    assert 'mdext' in posts.LIBRARY_VERSIONS
+    versions = dict(posts.LIBRARY_VERSIONS, mdext='changed')
+    assert posts.render_key('digest') != content_key('digest', posts.MD_EXTENSIONS, posts.MD_EXT_CONFIGS, versions)
+    assert posts.render_key('digest') == content_key('digest', posts.MD_EXTENSIONS, posts.MD_EXT_CONFIGS, posts.LIBRARY_VERSIONS)
@@ -0,0 +1,86 @@
+"""
+The response cache answers conditional requests with 304 and forgets its responses
+when the content changes (a new generation).
+
+    python -m pytest tests/
+"""
+
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from bottle import http_date
+import responsecache
+from responsecache import ResponseCacheMiddleware
+
+
+class Site(object):
+    """ A WSGI app whose page is the current text, counting how often it rendered it """
+
+    def __init__(self):
+        self.generation = 0
+        self.text = b'first'
+        self.renders = 0
+
+    def __call__(self, environ, start_response):
+        self.renders += 1
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [self.text]
+
+    def change(self, text):
+        self.text = text
+        self.generation += 1
+
+def cached(site):
+    return ResponseCacheMiddleware(site, lambda: site.generation, lambda environ: 'variant')
+
+def get(app, **headers):
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/', 'QUERY_STRING': ''}
+    environ.update(('HTTP_' + name.upper(), value) for name, value in headers.items())
+    captured = []
+    body = b''.join(app(environ, lambda status, headers, exc_info=None: captured.extend([status, dict(headers)])))
+    return captured[0], captured[1], body
+
+
+def test_responses_are_cached_per_generation():
+    site = Site()
+    app = cached(site)
+    assert get(app)[2] == b'first'
+    assert get(app)[2] == b'first'
+    assert site.renders == 1
+    site.change(b'second')
+    assert get(app)[2] == b'second'
+    assert site.renders == 2
+
+def test_if_none_match():
+    site = Site()
+    app = cached(site)
+    status, headers, _ = get(app)
+    etag = headers['ETag']
+    assert get(app, if_none_match=etag)[0].startswith('304')
+    assert get(app, if_none_match='"other", W/' + etag)[0].startswith('304')
+    assert get(app, if_none_match='"other"')[0].startswith('200')
+    site.change(b'second')
+    status, _, body = get(app, if_none_match=etag)
+    assert status.startswith('200') and body == b'second'
+
+def test_if_modified_since_after_a_change(monkeypatch):
+    now = [1000000.5]
+    monkeypatch.setattr(responsecache.time, 'time', lambda: now[0])
+    site = Site()
+    app = cached(site)
+    last_modified = get(app)[1]['Last-Modified']
+    assert get(app, if_modified_since=last_modified)[0].startswith('304')
+    # changed (or a post deleted) within the same second: the date must still move on
+    site.change(b'second')
+    status, headers, body = get(app, if_modified_since=last_modified)
+    assert status.startswith('200') and body == b'second'
+    assert headers['Last-Modified'] != last_modified
+    assert get(app, if_modified_since=headers['Last-Modified'])[0].startswith('304')
+    assert get(app, if_modified_since=http_date(now[0] - 60))[0].startswith('200')
+
+def test_if_none_match_takes_precedence():
+    site = Site()
+    app = cached(site)
+    last_modified = get(app)[1]['Last-Modified']
+    assert get(app, if_none_match='"other"', if_modified_since=last_modified)[0].startswith('200')
@@ -0,0 +1,73 @@
+"""
+The search index: BM25 ranking with boosted title and meta data matches, phrases,
+a stable order of equal scores and copies which do not see each other's changes.
+
+    python -m pytest tests/
+"""
+
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from searchindex import SearchIndex
+
+
+def index_of(*documents):
+    index = SearchIndex()
+    for doc, title, meta, text in documents:
+        index.add(doc, doc, title, meta, text)
+    return index
+
+
+def test_more_occurrences_rank_higher():
+    index = index_of(
+      ('once', 'A', '', 'python and some other words here'),
+      ('twice', 'B', '', 'python and python other words here'),
+      ('never', 'C', '', 'other words here'),
+    )
+    assert index.search('python') == ['twice', 'once']
+    assert index.search('python missing') == []
+
+def test_title_counts_more_than_meta_more_than_text():
+    index = index_of(
+      ('text', 'Other', 'misc', 'about gardening here'),
+      ('meta', 'Other', 'gardening', 'about things here'),
+      ('title', 'Gardening', 'misc', 'about things here'),
+    )
+    assert index.search('gardening') == ['title', 'meta', 'text']
+
+def test_phrase_matches_are_boosted():
+    index = index_of(
+      ('apart', 'T', '', 'new things in the york area'),
+      ('phrase', 'T', '', 'things in new york area'),
+    )
+    assert index.search('new york') == ['phrase', 'apart']
+    assert index.phrase(['new', 'york']) == {'phrase'}
+
+def test_phrases_do_not_cross_fields():
+    index = index_of(('doc', 'ends with new', 'york', ''))
+    assert index.phrase(['new', 'york']) == set()
+
+def test_equal_scores_in_a_stable_order():
+    documents = [(doc, 'Same title', '', 'same text') for doc in ('c', 'a', 'd', 'b')]
+    assert index_of(*documents).search('same') == ['a', 'b', 'c', 'd']
+    assert index_of(*reversed(documents)).search('same') == ['a', 'b', 'c', 'd']
+    ages = {'a': 3, 'b': 1, 'c': 2, 'd': 0}
+    assert index_of(*documents).search('same', tiebreak=ages.get) == ['d', 'b', 'c', 'a']
+
+def test_copies_share_nothing_that_changes():
+    index = index_of(
+      ('a', 'Alpha', '', 'common words'),
+      ('b', 'Beta', '', 'common words'),
+    )
+    copy = index.copy()
+    copy.add('c', 'c', 'Gamma', '', 'common words')
+    copy.remove('a')
+    index.add('b', 'b', 'Beta', '', 'changed text')
+    assert index.search('common') == ['a']
+    assert sorted(copy.search('common')) == ['b', 'c']
+    assert copy.search('changed') == []
+    assert index.search('alpha') == ['a'] and copy.search('alpha') == []
+    assert (len(index), len(copy)) == (2, 2)
+    assert index.total_length == sum(index.doc_lengths.values())
+    assert copy.total_length == sum(copy.doc_lengths.values())
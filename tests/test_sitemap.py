@@ -0,0 +1,70 @@
+"""
+Sitemaps are split into several documents listed by a sitemap index above the limits
+of the protocol on the number of URLs and the size of a sitemap.
+
+    python -m pytest tests/
+"""
+
+import os, sys, gzip
+from datetime import datetime
+from xml.etree import ElementTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import sitemap
+from sitemap import Sitemap, gunzip_stream
+
+BASELINK = 'https://example.com'
+NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+
+
+def urls(n):
+    return [('/post/{}'.format(i), datetime(2020, 1, 1 + i % 28), '1.0') for i in range(n)]
+
+def parse(data):
+    return ElementTree.fromstring(gzip.decompress(data))
+
+def locations(root, tag):
+    return [element.findtext(NS + 'loc') for element in root.iter(NS + tag)]
+
+
+def test_single_sitemap():
+    site = Sitemap(BASELINK, urls(3) + [('/search', None, None), ('/tag/a&b', None, '0.2')])
+    assert site.paths == ['/sitemap.xml']
+    data, etag = site.document('/sitemap.xml')
+    root = parse(data)
+    assert root.tag == NS + 'urlset'
+    assert locations(root, 'url')[-1] == BASELINK + '/tag/a&b'
+    assert len(locations(root, 'url')) == 5
+    assert etag.startswith('"') and site.document('/sitemap-1.xml') == (None, None)
+
+def test_split_at_the_url_limit():
+    site = Sitemap(BASELINK, urls(7), max_urls=3)
+    assert site.paths == ['/sitemap-1.xml', '/sitemap-2.xml', '/sitemap-3.xml', '/sitemap.xml']
+    index = parse(site.document('/sitemap.xml')[0])
+    assert index.tag == NS + 'sitemapindex'
+    assert locations(index, 'sitemap') == [BASELINK + '/sitemap-{}.xml'.format(i) for i in (1, 2, 3)]
+    listed = []
+    for number in (1, 2, 3):
+        listed += locations(parse(site.document('/sitemap-{}.xml'.format(number))[0]), 'url')
+    assert listed == [BASELINK + path for path, _, _ in urls(7)]
+    assert [len(locations(parse(site.document(path)[0]), 'url')) for path in site.paths[:3]] == [3, 3, 1]
+
+def test_split_at_the_byte_limit():
+    entry = len(sitemap.url_entry(BASELINK + '/post/0', datetime(2020, 1, 1), '1.0'))
+    max_bytes = len(sitemap.URLSET_START) + len(sitemap.URLSET_END) + 2 * entry + 1
+    site = Sitemap(BASELINK, urls(5), max_bytes=max_bytes)
+    assert len(site.paths) == 4
+    for path in site.paths[:3]:
+        assert len(gzip.decompress(site.document(path)[0])) <= max_bytes
+    # the index has the newest date of every sitemap
+    index = parse(site.document('/sitemap.xml')[0])
+    assert [element.findtext(NS + 'lastmod') for element in index.iter(NS + 'sitemap')] == ['2020-01-02', '2020-01-04', '2020-01-05']
+
+def test_oversized_entry_gets_a_sitemap_of_its_own():
+    site = Sitemap(BASELINK, urls(2), max_bytes=10)
+    assert len(site.paths) == 3
+
+def test_gunzip_stream():
+    data = Sitemap(BASELINK, urls(500)).document('/sitemap.xml')[0]
+    assert b''.join(gunzip_stream(data, chunk_size=100)) == gzip.decompress(data)
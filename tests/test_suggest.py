@@ -0,0 +1,69 @@
+"""
+Search suggestions: completions by the start of a title, of a later word of it or of a
+tag, the best weighted first, for short prefixes (computed in advance) and long ones
+(found by bisection, looking at no more than MAX_SCAN keys).
+
+    python -m pytest tests/
+"""
+
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import suggest
+from suggest import Suggestions
+
+
+def texts(completions):
+    return [text for text, _, _ in completions]
+
+
+def test_word_starts_and_weights():
+    suggestions = Suggestions([
+      ('Python tips', 'post', '/post/1', 1),
+      ('Learning Python', 'post', '/post/2', 1),
+      ('python', 'tag', '/tag/python', 5),
+      ('Pythagoras', 'post', '/post/3', 1),
+    ])
+    assert texts(suggestions.complete('pyth')) == ['python', 'Python tips', 'Pythagoras', 'Learning Python']
+    assert texts(suggestions.complete('  PYTHON   T')) == ['Python tips']
+    assert suggestions.complete('learning') == [('Learning Python', 'post', '/post/2')]
+    assert texts(suggestions.complete('py', limit=2)) == ['python', 'Python tips']
+    assert suggestions.complete('') == [] and suggestions.complete('java') == []
+
+def test_an_item_is_suggested_once():
+    suggestions = Suggestions([('Tea and tea', 'post', '/post/1', 1), ('Teapot', 'post', '/post/2', 1)])
+    assert texts(suggestions.complete('tea')) == ['Tea and tea', 'Teapot']
+    assert texts(suggestions.complete('tea a')) == ['Tea and tea']
+
+def brute_force(items, prefix, limit):
+    """ The completions as defined by the docstring of Suggestions, found the slow way """
+    prefix = suggest.normalize(prefix)
+    best = {}
+    for number, (text, kind, url, weight) in enumerate(items):
+        key = suggest.normalize(text)
+        for match in suggest.WORD_START_RE.finditer(key):
+            if key[match.start():].startswith(prefix):
+                value = (-(weight if match.start() == 0 else weight / 2.), number)
+                best[number] = min(best.get(number, value), value)
+    return [items[number][:3] for _, number in sorted(best.values())[:limit]]
+
+def test_short_and_long_prefixes_match_a_brute_force_search():
+    items = [('{} {} post {}'.format(first, second, number), 'post', '/post/{}'.format(number), number % 7)
+             for number, (first, second) in enumerate((first, second) for first in ('alpha', 'alpine', 'beta', 'alps')
+                                                     for second in ('alpha', 'gamma', 'alpaca'))]
+    suggestions = Suggestions(items)
+    for prefix in ('a', 'al', 'alp', 'alph', 'alpha g', 'alpine alpaca', 'post 1', 'gam', 'x'):
+        assert suggestions.complete(prefix) == brute_force(items, prefix, suggest.MAX_RESULTS), prefix
+
+def test_more_matches_than_are_scanned():
+    n = suggest.MAX_SCAN * 3
+    items = [('Common title {:05d}'.format(number), 'post', '/post/{}'.format(number), number) for number in range(n)]
+    suggestions = Suggestions(items)
+    # short prefixes are computed in advance from all matches
+    assert texts(suggestions.complete('com')) == ['Common title {:05d}'.format(number) for number in range(n - 1, n - 11, -1)]
+    # longer ones look at the first MAX_SCAN matching keys only
+    completions = texts(suggestions.complete('common t'))
+    assert len(completions) == suggest.MAX_RESULTS
+    assert completions == ['Common title {:05d}'.format(number) for number in range(suggest.MAX_SCAN - 1, suggest.MAX_SCAN - 11, -1)]
+    assert texts(suggestions.complete('common title 029')) == texts(brute_force(items, 'common title 029', suggest.MAX_RESULTS))
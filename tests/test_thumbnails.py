@@ -0,0 +1,56 @@
+"""
+Thumbnails are only ever written inside their cache folder, whatever path is requested.
+
+    python -m pytest tests/
+"""
+
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import thumbnails
+
+Image = pytest.importorskip('PIL.Image')
+
+
+@pytest.fixture
+def media(tmp_path):
+    media_folder = tmp_path / 'blog' / 'assets'
+    media_folder.mkdir(parents=True)
+    Image.new('RGB', (40, 30), 'red').save(str(media_folder / 'photo.jpg'))
+    cache_folder = tmp_path / 'cache' / 'thumbs'
+    return tmp_path, thumbnails.Thumbnails(str(media_folder), str(cache_folder))
+
+def files(folder):
+    return sorted(os.path.relpath(os.path.join(root, name), str(folder)) for root, _, names in os.walk(str(folder)) for name in names)
+
+
+def test_thumbnail_rendered_into_cache(media):
+    tmp_path, thumbs = media
+    assert thumbs.get('photo-10x10.jpg') == 'photo-10x10.jpg'
+    with Image.open(os.path.join(thumbs.cache_folder, 'photo-10x10.jpg')) as image:
+        assert image.size == (10, 10)
+
+@pytest.mark.parametrize('path', [
+  '../../blog/assets/photo-10x10.jpg',
+  '../../evil/../blog/assets/photo-10x10.jpg',
+  '/tmp/photo-10x10.jpg',
+  'sub/../../photo-10x10.jpg',
+  './photo-10x10.jpg',
+])
+def test_paths_leaving_the_cache_are_rejected(media, path):
+    tmp_path, thumbs = media
+    before = files(tmp_path)
+    assert thumbs.get(path) is None
+    assert thumbs.generate([path]) == 0
+    assert files(tmp_path) == before
+    assert not (tmp_path / 'evil').exists()
+
+def test_symlink_out_of_the_cache_is_rejected(media):
+    tmp_path, thumbs = media
+    os.makedirs(thumbs.cache_folder)
+    os.symlink(str(tmp_path / 'blog'), os.path.join(thumbs.cache_folder, 'link'))
+    assert thumbs._target('link/photo-10x10.jpg') is None
+    assert thumbs._target('sub/photo-10x10.jpg') == os.path.join(thumbs.cache_folder, 'sub', 'photo-10x10.jpg')
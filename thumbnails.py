@@ -0,0 +1,161 @@
+"""
+Resized variants of the images in the media folder for URLs with WordPress style size
+suffixes (like /wp-content/uploads/2018/05/photo-300x200.jpg for photo.jpg).
+
+Thumbnails are rendered with Pillow (if it is installed) when first requested and kept
+in a cache folder. They are cropped to the requested aspect ratio, never enlarged.
+"""
+
+import os, re, tempfile, logging, threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_RE = re.compile(r'(?P<base>.+)-(?P<width>\d+)x(?P<height>\d+)(?P<ext>\.(?:jpe?g|png|gif|webp))$', re.IGNORECASE)
+# references to thumbnails in the Markdown source of posts
+REFERENCE_RE = re.compile(r'''/(?:wp-content/uploads|assets)/(?P<path>[^\s"'()<>]+?-\d+x\d+\.(?:jpe?g|png|gif|webp))''', re.IGNORECASE)
+MAX_SIZE = 4096
+JPEG_QUALITY = 85
+
+
+def parse_thumbnail_path(path):
+    """ Return (original path, width, height) for the path of a thumbnail, or None """
+    match = THUMBNAIL_RE.match(path)
+    if not match:
+        return None
+    width, height = int(match.group('width')), int(match.group('height'))
+    if not 0 < width <= MAX_SIZE or not 0 < height <= MAX_SIZE:
+        return None
+    return match.group('base') + match.group('ext'), width, height
+
+def render_thumbnail(source, target, width, height):
+    """ Write the image source cropped and scaled down to width x height to target """
+    with Image.open(source) as image:
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        if width >= image.width and height >= image.height:
+            thumbnail = image.copy()
+        else:
+            thumbnail = ImageOps.fit(image, (min(width, image.width), min(height, image.height)), Image.LANCZOS)
+    options = {}
+    if image_format == 'JPEG':
+        if thumbnail.mode not in ('RGB', 'L'):
+            thumbnail = thumbnail.convert('RGB')
+        options = {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True}
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            thumbnail.save(f, image_format, **options)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class Thumbnails(object):
+    """ The thumbnails of the images in media_folder, kept in cache_folder """
+
+    def __init__(self, media_folder, cache_folder):
+        self.media_folder = os.path.abspath(media_folder)
+        self.cache_folder = os.path.abspath(cache_folder)
+        self._locks = {} # thumbnail path -> [lock, number of threads using it]
+        self._locks_lock = threading.Lock()
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def _source(self, path):
+        source = os.path.abspath(os.path.join(self.media_folder, path))
+        if not source.startswith(self.media_folder + os.sep) or not os.path.isfile(source):
+            return None
+        return source
+
+    def _target(self, path):
+        """ Return where the thumbnail at path is kept, or None if path could lead out of cache_folder """
+        parts = path.replace('\\', '/').split('/')
+        if os.path.isabs(path) or any(part in ('', '.', '..') for part in parts):
+            return None
+        target = os.path.join(self.cache_folder, *parts)
+        if not os.path.realpath(target).startswith(os.path.realpath(self.cache_folder) + os.sep):
+            return None
+        return target
+
+    def _is_current(self, target, source):
+        try:
+            return os.path.getmtime(target) >= os.path.getmtime(source)
+        except OSError:
+            return False
+
+    def get(self, path):
+        """
+        Return the path of the thumbnail relative to cache_folder (rendering it if needed),
+        or None if path does not name a thumbnail of an existing image.
+        """
+        parsed = parse_thumbnail_path(path)
+        if not parsed or not self.available:
+            return None
+        original, width, height = parsed
+        source = self._source(original)
+        target = self._target(path)
+        if source is None or target is None:
+            return None
+        if self._is_current(target, source):
+            return path
+        # concurrent requests for the same thumbnail wait for the first one to render it
+        with self._locks_lock:
+            entry = self._locks.setdefault(path, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                if not self._is_current(target, source):
+                    render_thumbnail(source, target, width, height)
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[path]
+        return path
+
+    def generate(self, paths, workers=None):
+        """ Render the thumbnails at the given paths not rendered yet. Returns the number rendered. """
+        jobs = []
+        for path in set(paths):
+            parsed = parse_thumbnail_path(path)
+            source = parsed and self._source(parsed[0])
+            target = self._target(path)
+            if source and target and not os.path.exists(os.path.join(self.media_folder, path)):
+                if not self._is_current(target, source):
+                    jobs.append((source, target, parsed[1], parsed[2]))
+        rendered = 0
+        if workers and workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(workers) as executor:
+                futures = [(job, executor.submit(render_thumbnail, *job)) for job in jobs]
+                for job, future in futures:
+                    try:
+                        future.result()
+                        rendered += 1
+                    except Exception as e:
+                        logger.warning('Could not render the thumbnail %s: %s', job[1], e)
+        else:
+            for job in jobs:
+                try:
+                    render_thumbnail(*job)
+                    rendered += 1
+                except Exception as e:
+                    logger.warning('Could not render the thumbnail %s: %s', job[1], e)
+        return rendered
+
+
+def referenced_thumbnails(posts):
+    """ Return the paths (relative to the media folder) of all thumbnails referenced in the posts """
+    paths = set()
+    for post in posts:
+        paths.update(match.group('path') for match in REFERENCE_RE.finditer(post['content']))
+    return paths
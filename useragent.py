@@ -0,0 +1,54 @@
+"""
+User agents of requests, parsed at most once per distinct User-Agent header.
+
+The template context holds proxies (UserAgentProxy, EnvironFlag) instead of per-request
+values: they look the values up in the environ of the request currently handled by
+the thread, so the shared defaults of the templates never change between requests.
+"""
+
+import logging
+from functools import lru_cache
+
+from bottle import request
+import user_agents
+
+logger = logging.getLogger(__name__)
+
+UA_KEY = 'localblog.ua'
+CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse(ua_string):
+    return user_agents.parse(ua_string)
+
+def user_agent(environ):
+    """ Return the parsed user agent of a request, parsing it on first use """
+    ua = environ.get(UA_KEY)
+    if ua is None:
+        ua = environ[UA_KEY] = parse(environ.get('HTTP_USER_AGENT', ''))
+    return ua
+
+def report():
+    info = parse.cache_info()
+    lookups = info.hits + info.misses
+    if not lookups:
+        return
+    logger.info('User agent cache: %d hits, %d misses (%.1f %% hit rate), %d of %d entries used',
+                info.hits, info.misses, 100. * info.hits / lookups, info.currsize, info.maxsize)
+
+
+class UserAgentProxy(object):
+    """ The user agent of the current request (only parsed if a template asks for one of its properties) """
+
+    def __getattr__(self, name):
+        return getattr(user_agent(request.environ), name)
+
+class EnvironFlag(object):
+    """ A boolean stored in the environ of the current request """
+
+    def __init__(self, key):
+        self.key = key
+
+    def __bool__(self):
+        return bool(request.environ.get(self.key))
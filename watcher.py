@@ -0,0 +1,138 @@
+import os, select, struct, logging, threading, ctypes, ctypes.util
+
+logger = logging.getLogger(__name__)
+
+# inotify event flags, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_Q_OVERFLOW  = 0x00004000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII') # wd, mask, cookie, len
+
+
+class Inotify(object):
+    """ A minimal inotify binding via ctypes (Linux only) watching a single folder """
+
+    def __init__(self, folder, mask=WATCH_MASK):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watch failed for ' + folder)
+
+    def read(self, timeout):
+        """ Return a list of (mask, name) events, waiting at most timeout seconds for the first one """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PostsWatcher(threading.Thread):
+    """
+    Watch a folder for added, changed and deleted files with the given extension and
+    call on_change(changed_files, removed_files) for them. Uses inotify where available,
+    otherwise the folder is polled with os.stat() every interval seconds.
+    """
+
+    def __init__(self, folder, extension, on_change, interval=2.0, settle=0.2):
+        super(PostsWatcher, self).__init__(name='PostsWatcher', daemon=True)
+        self.folder = folder
+        self.extension = '.' + extension
+        self.on_change = on_change
+        self.interval = interval
+        self.settle = settle
+        self._stop_event = threading.Event()
+        self._stats = self._scan()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _stat(self, name):
+        try:
+            st = os.stat(os.path.join(self.folder, name))
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _scan(self):
+        stats = {}
+        for name in os.listdir(self.folder):
+            if name.endswith(self.extension):
+                stat = self._stat(name)
+                if stat: stats[name] = stat
+        return stats
+
+    def _changes(self, names=None):
+        """ Compare the files (or all files in the folder if names is None) against the last known state """
+        if names is None:
+            current = self._scan()
+            names = set(current) | set(self._stats)
+        else:
+            current = dict((name, self._stat(name)) for name in names)
+        changed, removed = [], []
+        for name in names:
+            stat = current.get(name)
+            if stat is None:
+                if self._stats.pop(name, None) is not None:
+                    removed.append(name)
+            elif self._stats.get(name) != stat:
+                self._stats[name] = stat
+                changed.append(name)
+        return changed, removed
+
+    def _notify(self, changed, removed):
+        if not changed and not removed:
+            return
+        logger.info('Posts changed: %d added or modified, %d removed', len(changed), len(removed))
+        try:
+            self.on_change(changed, removed)
+        except Exception:
+            logger.exception('Could not reload the posts')
+
+    def run(self):
+        try:
+            inotify = Inotify(self.folder)
+        except (OSError, AttributeError) as e:
+            logger.info('Cannot use inotify (%s), polling %s every %.1f s instead', e, self.folder, self.interval)
+            inotify = None
+        try:
+            while not self._stop_event.is_set():
+                if inotify:
+                    self._notify(*self._wait_for_events(inotify))
+                else:
+                    self._stop_event.wait(self.interval)
+                    self._notify(*self._changes())
+        finally:
+            if inotify: inotify.close()
+
+    def _wait_for_events(self, inotify):
+        events = inotify.read(1.0)
+        if not events:
+            return [], []
+        # editors often write a file in several steps: wait until the folder settled down
+        while True:
+            more = inotify.read(self.settle)
+            if not more: break
+            events += more
+        if any(mask & IN_Q_OVERFLOW for mask, _ in events):
+            return self._changes()
+        return self._changes(set(name for _, name in events if name.endswith(self.extension)))